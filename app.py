@@ -1,24 +1,39 @@
+import asyncio
 import datetime
+import hashlib
+import json
+import logging
 import os
 import traceback
 from collections import defaultdict
 from contextlib import asynccontextmanager
+from typing import Literal
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Depends, Form, status, HTTPException
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from jose import jwt, JWTError
 from pydantic import BaseModel, ValidationError, constr, conint, confloat
-from sqlalchemy import select
 
-from main import log_func_call
+from services.archive_service import get_archived_records
 from services.auth_service import create_access_token
-from services.cooperator_service import get_cooperators, add_cooperator
-from services.service_service import get_services, add_service
-from static.models import init_db, ReminderRecord, async_session
+from services.bot_config import BOT_MODE, TELEGRAM_WEBHOOK_URL, TELEGRAM_WEBHOOK_PATH, TELEGRAM_WEBHOOK_SECRET
+from services.cooperator_service import list_cooperators, add_cooperator
+from services.leader_lock import LeaderLock, configured_workers
+from services.logger import log_func_call
+from services.metrics import collect, metrics_writer
+from services.record_service import list_records, decode_cursor
+from services.service_service import list_services, add_service
+from services.webhook_queue import enqueue_event, queue_stats
+from static.models import init_db
+
+if BOT_MODE == "webhook":
+    # Бот (aiogram, обработчики и их настройки) нужен панели только в режиме вебхука.
+    from aiogram.types import Update
+    from main import bot, dp, start_workers, stop_workers, close_clients
 
 load_dotenv()
 
@@ -30,12 +45,66 @@ WEB_PASSWORD = os.getenv("WEB_PASSWORD")
 LOGIN_ATTEMPTS_LIMIT = int(os.getenv("LOGIN_ATTEMPTS_LIMIT"))
 LOGIN_ATTEMPTS_WINDOW = int(os.getenv("LOGIN_ATTEMPTS_WINDOW"))
 login_attempts = defaultdict(list)
+# Сколько подсказок показывает за раз выпадающий список полей формы.
+DROPDOWN_PAGE_SIZE = 5
+
+
+# Обработка обновлений Telegram, принятых вебхуком; ссылки держим, чтобы задачи не собрал GC.
+_update_tasks: set[asyncio.Task] = set()
+
+
+async def run_bot_leader(lock: LeaderLock) -> None:
+    """Становится ведущим воркером: регистрирует вебхук Telegram и запускает фоновые задачи."""
+    await lock.wait()
+    log_func_call("run_bot_leader", f"pid={os.getpid()}")
+    if TELEGRAM_WEBHOOK_URL:
+        try:
+            await bot.set_webhook(
+                TELEGRAM_WEBHOOK_URL.rstrip("/") + TELEGRAM_WEBHOOK_PATH,
+                secret_token=TELEGRAM_WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types()
+            )
+        except Exception as e:
+            # Фоновые задачи нужны и без регистрации вебхука (например, если он уже зарегистрирован).
+            log_func_call("run_bot_leader", f"set_webhook failed: {e}", level=logging.ERROR)
+    # Каждая задача перезапускается после ошибки сама (main.supervise), gather ждёт до отмены.
+    tasks = start_workers()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await stop_workers(tasks)
 
 
 @asynccontextmanager
 async def lifespan(app):
     await init_db()
-    yield
+    # Снимок метрик воркера нужен /metrics, если запрос попадёт в другой воркер.
+    tasks = [asyncio.create_task(metrics_writer("app"))]
+    lock = None
+    if BOT_MODE == "webhook":
+        # Бот целиком (обновления Telegram и фоновые задачи) работает в одном воркере — ведущем;
+        # остальные воркеры отвечали бы Telegram 503, поэтому с --workers N не запускаемся.
+        workers = configured_workers()
+        if workers > 1:
+            log_func_call("lifespan", f"BOT_MODE=webhook supports a single worker, got {workers}",
+                          level=logging.ERROR)
+            raise RuntimeError("BOT_MODE=webhook requires a single uvicorn worker")
+        lock = app.state.bot_lock = LeaderLock()
+        if not lock.try_acquire():
+            # Блокировку держит другой процесс (второй экземпляр или ещё не завершившийся старый).
+            log_func_call("lifespan", f"{lock.path} is held by another process, Telegram updates get 503 "
+                          "until it is released", level=logging.ERROR)
+        tasks.append(asyncio.create_task(run_bot_leader(lock)))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if lock is not None:
+            await asyncio.gather(*_update_tasks, return_exceptions=True)
+            lock.release()
+            await close_clients()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -123,13 +192,42 @@ async def logout():
     return response
 
 
+def _clamp_limit(limit: int) -> int:
+    return min(max(limit, 1), 1000)
+
+
+def _etag_response(request: Request, content) -> Response:
+    """JSON-ответ с ETag по содержимому; 304 без тела, если у клиента та же версия."""
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _cooperator_json(c) -> dict:
+    return {"id": c.id, "branch_id": c.branch_id, "name": c.name}
+
+
+def _service_json(s) -> dict:
+    return {
+        "id": s.id,
+        "branch_id": s.branch_id,
+        "cooperator_id": s.cooperator_id,
+        "name": s.name,
+        "price": s.price,
+        "duration": s.duration
+    }
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request, token: str = Depends(get_token_from_cookie)):
     msg = request.query_params.get("msg")
-    cooperators = await get_cooperators()
-    services = await get_services()
-    cooperator_id_names = [f"{c.id} | {c.name}" for c in cooperators]
-    service_id_names = [f"{s.id} | {s.name}" for s in services]
+    # Подсказки на странице — только первая страница; остальное поля форм догружают из /api/*.
+    cooperators, _ = await list_cooperators(limit=DROPDOWN_PAGE_SIZE)
+    services, _ = await list_services(limit=DROPDOWN_PAGE_SIZE)
     return templates.TemplateResponse(
         "main.html",
         {
@@ -137,31 +235,98 @@ async def index(request: Request, token: str = Depends(get_token_from_cookie)):
             "messages": [("success", msg)] if msg else [],
             "cooperators": cooperators,
             "services": services,
-            "cooperator_id_names": cooperator_id_names,
-            "service_id_names": service_id_names
+            "page_size": DROPDOWN_PAGE_SIZE
         }
     )
 
 
 @app.get("/api/cooperators")
-async def api_cooperators(token: str = Depends(get_token_from_cookie)):
-    cooperators = await get_cooperators()
-    return [{"id": c.id, "branch_id": c.branch_id, "name": c.name} for c in cooperators]
+async def api_cooperators(
+        request: Request,
+        token: str = Depends(get_token_from_cookie),
+        branch_id: int | None = None,
+        q: str | None = None,
+        field: Literal["id", "branch_id", "name"] = "name",
+        after: int | None = None,
+        limit: int = 100
+):
+    cooperators, next_after = await list_cooperators(branch_id, q, field, after, _clamp_limit(limit))
+    return _etag_response(request, {"items": [_cooperator_json(c) for c in cooperators], "next": next_after})
 
 
 @app.get("/api/services")
-async def api_services(token: str = Depends(get_token_from_cookie)):
-    services = await get_services()
+async def api_services(
+        request: Request,
+        token: str = Depends(get_token_from_cookie),
+        branch_id: int | None = None,
+        cooperator_id: int | None = None,
+        q: str | None = None,
+        field: Literal["id", "branch_id", "cooperator_id", "name", "price", "duration"] = "name",
+        after: int | None = None,
+        limit: int = 100
+):
+    services, next_after = await list_services(branch_id, cooperator_id, q, field, after, _clamp_limit(limit))
+    return _etag_response(request, {"items": [_service_json(s) for s in services], "next": next_after})
+
+
+@app.get("/api/records")
+async def api_records(
+        request: Request,
+        token: str = Depends(get_token_from_cookie),
+        user_id: int | None = None,
+        branch_id: int | None = None,
+        cooperator_id: int | None = None,
+        date_from: datetime.datetime | None = None,
+        date_to: datetime.datetime | None = None,
+        after: str | None = None,
+        limit: int = 50
+):
+    try:
+        cursor = decode_cursor(after) if after else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    rows, next_after = await list_records(user_id, branch_id, cooperator_id, date_from, date_to, cursor,
+                                          _clamp_limit(limit))
+    items = [
+        {
+            "id": r.id,
+            "rubitime_id": r.rubitime_id,
+            "user_id": r.user_id,
+            "datetime": r.datetime.strftime('%Y-%m-%d %H:%M:%S'),
+            "name": r.name,
+            "phone": r.phone,
+            "confirmed": bool(r.confirmed),
+            "reminded_24h": bool(r.reminded_24h),
+            "reminded_12h": bool(r.reminded_12h),
+            "branch_id": mirror.branch_id if mirror else None,
+            "cooperator_id": mirror.cooperator_id if mirror else None,
+            "service_id": mirror.service_id if mirror else None
+        }
+        for r, mirror in rows
+    ]
+    return _etag_response(request, {"items": items, "next": next_after})
+
+
+@app.get("/api/records/archive")
+async def api_records_archive(
+        token: str = Depends(get_token_from_cookie),
+        user_id: int | None = None,
+        date_from: datetime.datetime | None = None,
+        date_to: datetime.datetime | None = None,
+        limit: int = 100
+):
+    records = await get_archived_records(user_id, date_from, date_to, _clamp_limit(limit))
     return [
         {
-            "id": s.id,
-            "branch_id": s.branch_id,
-            "cooperator_id": s.cooperator_id,
-            "name": s.name,
-            "price": s.price,
-            "duration": s.duration
+            "id": r.record_id,
+            "rubitime_id": r.rubitime_id,
+            "user_id": r.user_id,
+            "datetime": r.datetime.strftime('%Y-%m-%d %H:%M:%S'),
+            "name": r.name,
+            "phone": r.phone,
+            "archived_at": r.archived_at.strftime('%Y-%m-%d %H:%M:%S')
         }
-        for s in services
+        for r in records
     ]
 
 
@@ -215,54 +380,48 @@ async def webhook(request: Request):
     log_func_call("webhook", f"request from {request.client.host}")
     try:
         data = await request.json()
-        log_func_call("webhook", f"event={data.get('event')}, data={data.get('data')}")
-        event = data.get("event")
-        record_data = data.get("data", {})
-        rubitime_id = record_data.get("id")
-        async with async_session() as session:
-            rec = await session.execute(
-                select(ReminderRecord).where(ReminderRecord.rubitime_id == rubitime_id)
-            )
-            rec = rec.scalars().first()
-            dt_str = record_data.get("record")
-            name = record_data.get("name", "")
-            phone = record_data.get("phone", "")
-            user_id = record_data.get("user_id", None)
-            dt = None
-            try:
-                dt = datetime.datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                pass
-            if event == "event-create-record":
-                log_func_call("webhook", f"event-create-record rubitime_id={rubitime_id}")
-                if not rec and dt and user_id:
-                    new_rec = ReminderRecord(
-                        rubitime_id=rubitime_id,
-                        user_id=user_id,
-                        datetime=dt,
-                        name=name,
-                        phone=phone
-                    )
-                    session.add(new_rec)
-                    await session.commit()
-            elif event == "event-update-record":
-                log_func_call("webhook", f"event-update-record rubitime_id={rubitime_id}")
-                if rec and dt:
-                    rec.datetime = dt
-                    rec.name = name
-                    rec.phone = phone
-                    await session.commit()
-            elif event == "event-remove-record":
-                log_func_call("webhook", f"event-remove-record rubitime_id={rubitime_id}")
-                if rec:
-                    await session.delete(rec)
-                    await session.commit()
-        return JSONResponse({"status": "ok"})
+        log_func_call("webhook", f"event={data.get('event')}, data={data.get('data')}", level=logging.DEBUG)
+        # Только проверяем и ставим в очередь: в базу событие применит фоновый обработчик.
+        event_id = await enqueue_event(data)
+        if event_id is None:
+            # Повторная доставка: отвечаем 200, чтобы Rubitime перестал повторять.
+            return JSONResponse({"status": "ok", "duplicate": True})
+        return JSONResponse({"status": "ok", "queued": event_id})
     except Exception as e:
-        log_func_call("webhook", f"error: {e}")
+        log_func_call("webhook", f"error: {e}", level=logging.WARNING)
         return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
 
 
+@app.get("/api/webhook/stats")
+async def api_webhook_stats(token: str = Depends(get_token_from_cookie)):
+    return await queue_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    # Без авторизации, как принято для Prometheus; персональных данных в метриках нет.
+    return PlainTextResponse(await collect("app"), media_type="text/plain; version=0.0.4")
+
+
+async def telegram_webhook(request: Request):
+    if TELEGRAM_WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != TELEGRAM_WEBHOOK_SECRET:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    if not request.app.state.bot_lock.is_leader:
+        # Изоляция событий FSM, планировщик напоминаний и сброс кэша расписаний живут в процессе
+        # ведущего; остальные воркеры отказывают, и Telegram повторит доставку.
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # Отвечаем Telegram сразу, обработка идёт в фоне — как при handle_as_tasks в polling.
+    task = asyncio.create_task(dp.feed_update(bot, update))
+    _update_tasks.add(task)
+    task.add_done_callback(_update_tasks.discard)
+    return JSONResponse({"ok": True})
+
+
+if BOT_MODE == "webhook":
+    app.add_api_route(TELEGRAM_WEBHOOK_PATH, telegram_webhook, methods=["POST"])
+
+
 @app.post("/token")
 async def login_token(form_data: OAuth2PasswordRequestForm = Depends()):
     if form_data.username == WEB_LOGIN and form_data.password == WEB_PASSWORD:
@@ -0,0 +1,99 @@
+"""Память, занимаемая состоянием FSM при множестве одновременных записей.
+
+Запуск: python -m benchmarks.fsm_memory_bench [сессий] [сотрудников] [дней]
+
+Сравниваются две раскладки данных в MemoryStorage aiogram:
+  legacy  — в состоянии каждого пользователя лежит собственная копия ответа
+            get-schedule, список свободного времени и confirm_data;
+  compact — в состоянии только идентификаторы, дата и номер страницы,
+            а расписание — один общий ScheduleView на пару сотрудник/услуга.
+"""
+import asyncio
+import datetime
+import json
+import sys
+import tracemalloc
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from services.schedule_cache import ScheduleView
+
+BOT_ID = 1
+
+
+def fake_schedule(days: int) -> str:
+    """Ответ get-schedule в виде JSON: слоты каждые 30 минут с 9:00 до 21:00."""
+    start = datetime.date.today()
+    data = {}
+    for day in range(days):
+        date = str(start + datetime.timedelta(days=day))
+        data[date] = {
+            f"{hour:02d}:{minute:02d}": {"available": (hour + minute + day) % 3 != 0}
+            for hour in range(9, 21) for minute in (0, 30)
+        }
+    return json.dumps({"status": "ok", "data": data})
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+
+
+async def fill_legacy(storage: MemoryStorage, sessions: int, cooperators: int, raw: str) -> None:
+    for user_id in range(sessions):
+        schedule = json.loads(raw)["data"]
+        date = sorted(schedule)[user_id % len(schedule)]
+        await storage.set_data(_key(user_id), {
+            "cooperator_id": user_id % cooperators,
+            "service_id": user_id % cooperators,
+            "schedule": schedule,
+            "date_page": 0,
+            "date": date,
+            "times": [t for t, v in schedule[date].items() if v["available"]],
+            "datetime": f"{date} 10:00:00",
+            "confirm_data": {
+                "cooperator_name": "Иванов И.И.", "service_name": "Мужская стрижка",
+                "datetime": f"{date} 10:00:00", "phone": "+79001234567", "name": "Иван",
+            },
+        })
+
+
+async def fill_compact(storage: MemoryStorage, sessions: int, cooperators: int, raw: str) -> dict:
+    shared = {c: ScheduleView.build(json.loads(raw)["data"]) for c in range(cooperators)}
+    for user_id in range(sessions):
+        view = shared[user_id % cooperators]
+        date = view.dates[user_id % len(view.dates)]
+        await storage.set_data(_key(user_id), {
+            "cooperator_id": user_id % cooperators,
+            "service_id": user_id % cooperators,
+            "date_page": 0,
+            "date": date,
+            "datetime": f"{date} 10:00:00",
+        })
+    return shared
+
+
+async def measure(fill, sessions: int, cooperators: int, raw: str) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    storage = MemoryStorage()
+    # Общие расписания учитываются вместе с сессиями, пока идёт замер.
+    shared = await fill(storage, sessions, cooperators, raw)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del storage, shared
+    return used
+
+
+async def main(sessions: int, cooperators: int, days: int) -> None:
+    raw = fake_schedule(days)
+    print(f"{sessions} sessions, {cooperators} cooperators, {days} days of schedule")
+    for name, fill in (("legacy", fill_legacy), ("compact", fill_compact)):
+        used = await measure(fill, sessions, cooperators, raw)
+        print(f"{name:>8}: {used / 2 ** 20:8.2f} MiB total, {used / sessions / 1024:7.2f} KiB per session")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    sessions, cooperators, days = args + [2000, 4, 30][len(args):]
+    asyncio.run(main(sessions, cooperators, days))
@@ -0,0 +1,86 @@
+"""Сравнение пропускной способности записи в SQLite: настройки по умолчанию и режим WAL.
+
+Запуск: python -m benchmarks.sqlite_write_bench [процессов] [писателей] [коммитов]
+
+Несколько процессов (как бот и веб-панель) одновременно коммитят вставки
+в reminder_records одного файла, параллельно идут чтения. Печатается число
+коммитов в секунду и ошибок "database is locked" для каждого режима.
+"""
+import asyncio
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from static.models import Base, ReminderRecord, create_engine_from_url
+
+
+async def _worker(url: str, tuned: bool, proc: int, writers: int, commits: int) -> tuple[int, int]:
+    engine = create_engine_from_url(url, tuned=tuned)
+    session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    done, locked = 0, 0
+
+    async def write(writer: int) -> None:
+        nonlocal done, locked
+        for i in range(commits):
+            try:
+                async with session_factory() as session:
+                    session.add(ReminderRecord(
+                        rubitime_id=(proc * writers + writer) * commits + i,
+                        user_id=writer, datetime=datetime.datetime.now(), name="bench", phone="+70000000000"
+                    ))
+                    await session.commit()
+                done += 1
+            except OperationalError:
+                locked += 1
+
+    async def read() -> None:
+        for _ in range(commits):
+            try:
+                async with session_factory() as session:
+                    await session.execute(select(func.count()).select_from(ReminderRecord))
+            except OperationalError:
+                pass
+
+    await asyncio.gather(*(write(w) for w in range(writers)), read())
+    await engine.dispose()
+    return done, locked
+
+
+def _run_process(args) -> tuple[int, int]:
+    return asyncio.run(_worker(*args))
+
+
+async def _init(url: str, tuned: bool) -> None:
+    engine = create_engine_from_url(url, tuned=tuned)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+def bench(tuned: bool, processes: int, writers: int, commits: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        asyncio.run(_init(url, tuned))
+        started = time.perf_counter()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_run_process, [(url, tuned, p, writers, commits) for p in range(processes)])
+        elapsed = time.perf_counter() - started
+    done = sum(r[0] for r in results)
+    locked = sum(r[1] for r in results)
+    mode = "WAL + pragmas" if tuned else "default"
+    print(f"{mode:>14}: {done} commits in {elapsed:.2f}s = {done / elapsed:.0f} commits/s, locked errors: {locked}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    processes, writers, commits = args + [2, 8, 100][len(args):]
+    bench(False, processes, writers, commits)
+    bench(True, processes, writers, commits)
@@ -0,0 +1,48 @@
+"""Время импорта и пиковая память (RSS) точек входа: веб-панели и бота.
+
+Запуск: python -m benchmarks.startup_bench [повторов]
+
+Каждая точка входа импортируется в отдельном свежем процессе; печатается
+медиана времени импорта, пиковый RSS и число загруженных модулей. Для бота
+нужны те же переменные окружения, что и для python main.py.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ENTRY_POINTS = (
+    ("app", "app", {"BOT_MODE": "polling"}),
+    ("app (webhook)", "app", {"BOT_MODE": "webhook"}),
+    ("main", "main", {}),
+)
+
+CHILD = """
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, len(sys.modules))
+"""
+
+
+def run_once(module: str, env: dict) -> tuple[float, int, int]:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module)],
+        env={**os.environ, **env}, capture_output=True, text=True, check=True
+    ).stdout.split()
+    elapsed, rss_kib, modules = out[-3:]
+    return float(elapsed), int(rss_kib), int(modules)
+
+
+def main(repeats: int) -> None:
+    print(f"{repeats} runs per entry point")
+    for name, module, env in ENTRY_POINTS:
+        runs = [run_once(module, env) for _ in range(repeats)]
+        elapsed = statistics.median(r[0] for r in runs)
+        rss = statistics.median(r[1] for r in runs)
+        print(f"{name:>14}: import {elapsed * 1000:7.1f} ms, max RSS {rss / 1024:6.1f} MiB, {runs[0][2]} modules")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
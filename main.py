@@ -5,39 +5,54 @@
 #  + строка для ручного ввода, если админ хочет добавить новое
 import asyncio
 import datetime
+import functools
+import logging
 import os
 import random
 import re
-import time
-from typing import Any, Generator, TypeVar
+from typing import Awaitable, Callable
 
 import aiohttp
 from aiogram import Bot, Dispatcher, F
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.types import Message
 from dotenv import load_dotenv
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-
-from static.models import Cooperator, Service, async_session, ReminderRecord
+from sqlalchemy.exc import IntegrityError
+
+from services.archive_service import archive_worker
+from services.bot_middlewares import HandlerMetricsMiddleware, TracingMiddleware, TracingRequestMiddleware
+from services.catalog import catalog, CatalogSnapshot
+from services.fsm_storage import create_fsm_storage, fsm_cleanup_worker, SQLAlchemyStorage
+from services.keyboards import (
+    get_lk_keyboard, get_confirm_keyboard, cooperators_keyboard, services_keyboard,
+    date_page_keyboard, date_pages, NEXT_PAGE, PREV_PAGE,
+)
+from services.logger import get_logger, log_func_call, LOG_SAMPLE_RATE
+from services.metrics import metrics_writer
+from services.record_mirror import save_mirror
+from services.record_service import (
+    user_records_query, user_reminders_query, user_record_at_query, records_by_rubitime_id_query
+)
+from services.record_sync import RecordReconciler
+from services.reminder_scheduler import reminder_scheduler
+from services.rubitime_client import rubitime_client, PRIORITY_USER, PRIORITY_PREFETCH
+from services.schedule_cache import schedule_cache, ScheduleView, SCHEDULE_STALE_TTL
+from services.schedule_prefetcher import SchedulePrefetcher, SCHEDULE_PREFETCH_ENABLED
+from services.sms_queue import sms_dispatcher
+from services.telegram_sender import TelegramSender
+from services.webhook_queue import webhook_consumer
+from static.models import async_session, async_read_session, ReminderRecord, init_db
 
 load_dotenv()
 
 TELEGRAM_API_TOKEN = os.getenv("TELEGRAM_API_TOKEN")
-RUBITIME_API_KEY = os.getenv("RUBITIME_API_KEY")
-SMSRU_API_ID = os.getenv("SMSRU_API_ID")
 BRANCH_ID = int(os.getenv("BRANCH_ID"))
-CACHE_EXPIRED_TIMEOUT = int(os.getenv("CACHE_EXPIRED_TIMEOUT"))
 PHONE_CONFIRMATION_ENABLED = os.getenv("PHONE_CONFIRMATION_ENABLED").lower() in ('true', '1', 't')
+# Пауза перед перезапуском упавшей фоновой задачи, секунд.
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "5"))
 
-
-def log_func_call(func_name: str, extra: str | None = None) -> None:
-    """Логирует вызов функции."""
-    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    msg = f"[{now}] {func_name} called"
-    if extra:
-        msg += f" | {extra}"
-    print(msg)
+log = get_logger("bot")
 
 
 def generate_sms_code() -> str:
@@ -49,21 +64,7 @@ def generate_sms_code() -> str:
 async def send_sms_code(phone: str, code: str) -> dict:
     """Отправляет SMS-код подтверждения."""
     log_func_call("send_sms_code", f"phone={phone}")
-    url = "https://sms.ru/sms/send"
-    phone = phone.lstrip("+")
-    params = {
-        "api_id": SMSRU_API_ID,
-        "to": phone,
-        "msg": f"Ваш код подтверждения: {code}",
-        "json": 1
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as resp:
-            if resp.status != 200:
-                text = await resp.text()
-                print(f"SMS.ru error: {resp.status}, {text}")
-                return {"status": "ERROR", "message": text}
-            return await resp.json()
+    return await sms_dispatcher.send(phone, f"Ваш код подтверждения: {code}")
 
 
 def normalize_phone(phone: str) -> str | None:
@@ -87,74 +88,63 @@ bot = Bot(
     token=TELEGRAM_API_TOKEN,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
-dp = Dispatcher()
-
-_cooperators_cache = {"value": None, "ts": 0}
-_services_cache = {}
+fsm_storage = create_fsm_storage()
+# Обновления одного пользователя обрабатываются по очереди, иначе они гоняются за состояние FSM.
+# Изоляция внутри процесса: в режиме вебхука обновления принимает только ведущий воркер.
+dp = Dispatcher(storage=fsm_storage, events_isolation=SimpleEventIsolation())
+dp.message.middleware(TracingMiddleware())
+dp.message.middleware(HandlerMetricsMiddleware())
+bot.session.middleware(TracingRequestMiddleware())
 
 
-def _cache_expired(ts, timeout=CACHE_EXPIRED_TIMEOUT):
-    return time.time() - ts > timeout
+async def get_catalog() -> CatalogSnapshot:
+    """Возвращает снимок справочника сотрудников и услуг из общего кэша."""
+    # Вызывается почти в каждом обработчике и обслуживается из кэша — пишем лишь выборку.
+    log_func_call("get_catalog", level=logging.DEBUG, sample=LOG_SAMPLE_RATE)
+    return await catalog.get()
 
 
-async def get_cooperators(force_refresh=False) -> list[Cooperator]:
-    """Возвращает список сотрудников с кэшированием."""
-    log_func_call("get_cooperators")
-    global _cooperators_cache
-    if not force_refresh and _cooperators_cache["value"] is not None and not _cache_expired(_cooperators_cache["ts"]):
-        return _cooperators_cache["value"]
-    async with async_session() as session:
-        result = await session.execute(select(Cooperator).options(selectinload(Cooperator.services)))
-        cooperators = result.scalars().all()
-        _cooperators_cache = {"value": cooperators, "ts": time.time()}
-        return cooperators
-
-
-async def get_services_by_cooperator(cooperator_id: int, force_refresh=False) -> list[Service]:
-    """Возвращает список услуг по сотруднику с кэшированием."""
-    log_func_call("get_services_by_cooperator", f"cooperator_id={cooperator_id}")
-    global _services_cache
-    cache = _services_cache.get(cooperator_id)
-    if not force_refresh and cache and not _cache_expired(cache["ts"]):
-        return cache["value"]
-    async with async_session() as session:
-        result = await session.execute(select(Service).where(Service.cooperator_id == cooperator_id))
-        services = result.scalars().all()
-        _services_cache[cooperator_id] = {"value": services, "ts": time.time()}
-        return services
+async def get_available_schedule(branch_id: int, cooperator_id: int, service_id: int,
+                                 max_stale: float = 0.0) -> ScheduleView | None:
+    """Получает доступное расписание для записи (через общий кэш)."""
+    log_func_call("get_available_schedule",
+                  f"branch_id={branch_id}, cooperator_id={cooperator_id}, service_id={service_id}",
+                  level=logging.DEBUG, sample=LOG_SAMPLE_RATE)
+    return await schedule_cache.get(
+        (branch_id, cooperator_id, service_id),
+        lambda: fetch_schedule(branch_id, cooperator_id, service_id),
+        max_stale=max_stale
+    )
 
 
-def clear_cooperators_cache():
-    global _cooperators_cache
-    _cooperators_cache = {"value": None, "ts": 0}
+async def get_booking_names(data: dict) -> tuple[str, str]:
+    """Имена сотрудника и услуги для текущей записи по идентификаторам из состояния."""
+    snapshot = await get_catalog()
+    cooperator = snapshot.cooperators_by_id.get(data["cooperator_id"])
+    service = snapshot.services_by_id.get(data["service_id"])
+    return (cooperator.name if cooperator else "Неизвестно", service.name if service else "Неизвестно")
 
 
-def clear_services_cache(cooperator_id=None):
-    global _services_cache
-    if cooperator_id is None:
-        _services_cache = {}
-    else:
-        _services_cache.pop(cooperator_id, None)
+async def get_session_schedule(data: dict, max_stale: float = SCHEDULE_STALE_TTL) -> ScheduleView | None:
+    """Расписание для уже начатой записи: в состоянии хранятся только идентификаторы."""
+    return await get_available_schedule(BRANCH_ID, data["cooperator_id"], data["service_id"],
+                                        max_stale=max_stale)
 
 
-async def get_available_schedule(branch_id: int, cooperator_id: int, service_id: int) -> dict | None:
-    """Получает доступное расписание для записи."""
-    log_func_call("get_available_schedule",
-                  f"branch_id={branch_id}, cooperator_id={cooperator_id}, service_id={service_id}")
+async def fetch_schedule(branch_id: int, cooperator_id: int, service_id: int,
+                         priority: int = PRIORITY_USER) -> ScheduleView | None:
+    """Запрашивает расписание у Rubitime в обход кэша."""
     payload = {
-        "rk": RUBITIME_API_KEY,
         "branch_id": branch_id,
         "cooperator_id": cooperator_id,
         "service_id": service_id,
         "only_available": 1
     }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://rubitime.ru/api2/get-schedule", json=payload) as resp:
-                res = await resp.json()
-                if res.get("status") == "ok":
-                    return res["data"]
-                return {}
+        res = await rubitime_client.call("get-schedule", payload, priority=priority)
+        if res.get("status") == "ok":
+            return ScheduleView.build(res["data"] or {})
+        return ScheduleView()
     except aiohttp.ClientError:
         return None
     except asyncio.TimeoutError:
@@ -163,37 +153,6 @@ async def get_available_schedule(branch_id: int, cooperator_id: int, service_id:
         return None
 
 
-T = TypeVar("T")
-
-
-def chunked(lst: list[T], n: int) -> Generator[list[T], Any, None]:
-    """Разбивает список на чанки по n элементов."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
-
-
-def get_lk_keyboard() -> ReplyKeyboardMarkup:
-    """Клавиатура личного кабинета."""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="🗂 Мои записи")],
-            [KeyboardButton(text="📝 Новая запись")],
-            [KeyboardButton(text="❌ Отмена записи")],
-        ],
-        resize_keyboard=True
-    )
-
-
-def get_confirm_keyboard() -> ReplyKeyboardMarkup:
-    """Клавиатура подтверждения."""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Да"), KeyboardButton(text="Нет")]
-        ],
-        resize_keyboard=True
-    )
-
-
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
@@ -233,12 +192,8 @@ async def add_record(msg: Message, state: FSMContext) -> None:
     await state.clear()
     await state.set_state(BookingStates.selecting_cooperator)
     await state.update_data(date_page=0)
-    cooperators = await get_cooperators()
-    names = [f"{c.id}: {c.name}" for c in cooperators]
-    kb = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=name)] for name in names],
-        resize_keyboard=True
-    )
+    snapshot = await get_catalog()
+    kb = cooperators_keyboard(snapshot)
     await msg.answer("👨‍⚕️ Выберите сотрудника:", reply_markup=kb)
 
 
@@ -247,23 +202,29 @@ async def my_records(msg: Message) -> None:
     """Показывает записи пользователя."""
     log_func_call("my_records", f"user_id={msg.from_user.id}")
     uid = msg.from_user.id
-    async with async_session() as session:
-        records = await session.execute(
-            select(ReminderRecord).where(ReminderRecord.user_id == uid)
+    async with async_read_session() as session:
+        records = await session.execute(user_records_query(uid))
+        recs = records.all()
+    if not recs:
+        await msg.answer("ℹ️ У вас нет записей.")
+        return
+    snapshot = await get_catalog()
+    text = "🗂 <b>Ваши записи</b>:\n"
+    for r, mirror in recs:
+        text += f"🗓 <b>{r.datetime.strftime('%Y-%m-%d %H:%M')}</b>\n"
+        # Сотрудник и услуга известны из локального зеркала Rubitime, без запроса к API.
+        cooperator = snapshot.cooperators_by_id.get(mirror.cooperator_id) if mirror else None
+        service = snapshot.services_by_id.get(mirror.service_id) if mirror else None
+        if cooperator:
+            text += f"👨‍⚕️ {cooperator.name}\n"
+        if service:
+            text += f"💼 {service.name}\n"
+        text += (
+            f"👤 {r.name}\n"
+            f"📞 {r.phone}\n"
+            "------\n"
         )
-        recs = records.scalars().all()
-        if not recs:
-            await msg.answer("ℹ️ У вас нет записей.")
-            return
-        text = "🗂 <b>Ваши записи</b>:\n"
-        for r in recs:
-            text += (
-                f"🗓 <b>{r.datetime.strftime('%Y-%m-%d %H:%M')}</b>\n"
-                f"👤 {r.name}\n"
-                f"📞 {r.phone}\n"
-                "------\n"
-            )
-        await msg.answer(text)
+    await msg.answer(text)
 
 
 @dp.message(F.text.in_(["/cancel", "❌ Отмена записи"]))
@@ -271,16 +232,14 @@ async def cancel_record(msg: Message, state: FSMContext) -> None:
     """Начало сценария отмены записи."""
     log_func_call("cancel_record", f"user_id={msg.from_user.id}")
     uid = msg.from_user.id
-    async with async_session() as session:
-        records = await session.execute(
-            select(ReminderRecord).where(ReminderRecord.user_id == uid)
-        )
+    async with async_read_session() as session:
+        records = await session.execute(user_reminders_query(uid))
         recs = records.scalars().all()
         if not recs:
             await msg.answer("ℹ️ У вас нет записей для отмены.")
             return
         await state.set_state(BookingStates.cancelling_record)
-        await state.update_data(cancel_list=[(r.id, r.rubitime_id, r.datetime) for r in recs])
+        await state.update_data(cancel_list=[(r.id, r.rubitime_id, r.datetime.strftime('%Y-%m-%d %H:%M')) for r in recs])
         kb = ReplyKeyboardMarkup(
             keyboard=[[KeyboardButton(text=f"{r.id}: {r.datetime.strftime('%Y-%m-%d %H:%M')}")] for r in recs],
             resize_keyboard=True
@@ -303,19 +262,12 @@ async def select_cooperator(msg: Message, state: FSMContext) -> None:
     except Exception:
         await msg.answer("Пожалуйста, выберите сотрудника из списка.")
         return
-    cooperators = await get_cooperators()
-    cooperator_ids = [c.id for c in cooperators]
-    if cooperator_id not in cooperator_ids:
+    snapshot = await get_catalog()
+    if cooperator_id not in snapshot.cooperators_by_id:
         await msg.answer("Пожалуйста, выберите сотрудника из списка.")
         return
     await state.update_data(cooperator_id=cooperator_id)
-    services = await get_services_by_cooperator(cooperator_id)
-    await state.update_data(services={s.id: s.name for s in services})
-    names = [f"{s.id}: {s.name}" for s in services]
-    kb = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=name)] for name in names],
-        resize_keyboard=True
-    )
+    kb = services_keyboard(snapshot, cooperator_id)
     await state.set_state(BookingStates.selecting_service)
     await msg.answer("💼 Выберите услугу:", reply_markup=kb)
 
@@ -325,43 +277,30 @@ async def select_service(msg: Message, state: FSMContext) -> None:
     """Выбор услуги."""
     log_func_call("select_service", f"user_id={msg.from_user.id}")
     data = await state.get_data()
-    services = data.get("services", {})
+    cooperator_id = data["cooperator_id"]
     text = msg.text.strip()
     try:
         service_id = int(text.split(":")[0])
     except Exception:
         await msg.answer("Пожалуйста, выберите услугу из списка.")
         return
-    if service_id not in services:
+    snapshot = await get_catalog()
+    service = snapshot.services_by_id.get(service_id)
+    if service is None or service.cooperator_id != cooperator_id:
         await msg.answer("Пожалуйста, выберите услугу из списка.")
         return
     await state.update_data(service_id=service_id)
-    cooperator_id = data["cooperator_id"]
     schedule = await get_available_schedule(BRANCH_ID, cooperator_id, service_id)
-    if not schedule:
+    if schedule is None or not schedule.dates:
         await msg.answer("Нет доступных дат для записи.")
         return
-    await state.update_data(schedule=schedule, date_page=0)
+    await state.update_data(date_page=0)
     await state.set_state(BookingStates.selecting_date)
-    await send_date_page(msg, state)
+    await send_date_page(msg, schedule, 0)
 
 
-async def send_date_page(msg: Message, state: FSMContext) -> None:
-    data = await state.get_data()
-    schedule = data["schedule"]
-    dates = sorted(schedule.keys())
-    page = data.get("date_page", 0)
-    pages = list(chunked(dates, 7))
-    current = pages[page] if page < len(pages) else []
-    kb_buttons = [[KeyboardButton(text=date)] for date in current]
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(KeyboardButton(text="<< Назад"))
-    if page < len(pages) - 1:
-        nav_buttons.append(KeyboardButton(text="Вперед >>"))
-    if nav_buttons:
-        kb_buttons.append(nav_buttons)
-    kb = ReplyKeyboardMarkup(keyboard=kb_buttons, resize_keyboard=True)
+async def send_date_page(msg: Message, schedule: ScheduleView, page: int) -> None:
+    kb = date_page_keyboard(schedule.dates, page)
     await msg.answer("📅 Выберите дату:", reply_markup=kb)
 
 
@@ -370,28 +309,30 @@ async def select_date(msg: Message, state: FSMContext) -> None:
     """Выбор даты записи."""
     log_func_call("select_date", f"user_id={msg.from_user.id}")
     data = await state.get_data()
-    schedule = data["schedule"]
-    dates = sorted(schedule.keys())
-    page = data.get("date_page", 0)
-    pages = list(chunked(dates, 7))
-    current = pages[page] if page < len(pages) else []
+    schedule = await get_session_schedule(data)
+    if schedule is None:
+        await msg.answer("Не удалось получить расписание. Попробуйте позже.")
+        return
+    pages = date_pages(schedule.dates)
+    page = min(data.get("date_page", 0), max(len(pages) - 1, 0))
+    current = pages[page] if page < len(pages) else ()
     text = msg.text.strip()
-    if text == "Вперед >>":
+    if text == NEXT_PAGE and page < len(pages) - 1:
         await state.update_data(date_page=page + 1)
-        await send_date_page(msg, state)
+        await send_date_page(msg, schedule, page + 1)
         return
-    if text == "<< Назад":
+    if text == PREV_PAGE and page > 0:
         await state.update_data(date_page=page - 1)
-        await send_date_page(msg, state)
+        await send_date_page(msg, schedule, page - 1)
         return
     if text not in current:
         await msg.answer("Пожалуйста, выберите дату из списка.")
         return
-    times = [t for t, v in schedule[text].items() if v["available"]]
+    times = schedule.times.get(text, ())
     if not times:
         await msg.answer("Нет доступного времени на эту дату.")
         return
-    await state.update_data(date=text, times=times)
+    await state.update_data(date=text)
     await state.set_state(BookingStates.selecting_time)
     await msg.answer(
         "⏰ Введите время в формате ЧЧ:ММ (например, 12:30).\nДоступно:\n" + ", ".join(times),
@@ -408,14 +349,18 @@ async def select_time(msg: Message, state: FSMContext) -> None:
     if not re.fullmatch(r"\d{1,2}:\d{2}", time):
         await msg.answer("Введите время в формате ЧЧ:ММ, например 12:30.")
         return
-    available_times = data["times"]
+    # Выбранный слот проверяем по свежему расписанию: устаревшее допустимо только для просмотра дат.
+    schedule = await get_session_schedule(data, max_stale=0)
+    if schedule is None:
+        await msg.answer("Не удалось получить расписание. Попробуйте позже.")
+        return
+    available_times = schedule.times.get(data["date"], ())
     if time not in available_times:
         await msg.answer("Это время недоступно для записи. Доступные варианты:\n" + ", ".join(available_times))
         return
-    service_id = data["service_id"]
-    async with async_session() as session:
-        service = await session.get(Service, service_id)
-        duration = service.duration if service else 0
+    snapshot = await get_catalog()
+    service = snapshot.services_by_id.get(data["service_id"])
+    duration = service.duration if service else 0
     start_hour, start_minute = map(int, time.split(":"))
     end_minute = start_minute + duration
     end_hour = start_hour + end_minute // 60
@@ -449,14 +394,9 @@ async def get_phone(msg: Message, state: FSMContext) -> None:
         await msg.answer("Введите номер телефона в формате +79000000000, 79000000000, 89000000000 или 9000000000.")
         return
     await state.update_data(phone=phone)
-    async with async_session() as session:
+    async with async_read_session() as session:
         dt = datetime.datetime.strptime(data["datetime"], "%Y-%m-%d %H:%M:%S")
-        exists = await session.execute(
-            select(ReminderRecord).where(
-                ReminderRecord.user_id == msg.from_user.id,
-                ReminderRecord.datetime == dt
-            )
-        )
+        exists = await session.execute(user_record_at_query(msg.from_user.id, dt))
         if exists.scalars().first():
             await msg.answer("У вас уже есть запись на это время.")
             await state.clear()
@@ -466,32 +406,14 @@ async def get_phone(msg: Message, state: FSMContext) -> None:
         await state.update_data(sms_code=sms_code)
         sms_result = await send_sms_code(phone, sms_code)
         if sms_result.get("status") == "OK":
-            sms_info = next(iter(sms_result["sms"].values()), {})
-            if sms_info.get("status") == "OK":
-                await state.set_state(BookingStates.confirming_sms)
-                await msg.answer("Введите код из SMS для подтверждения записи:")
-            else:
-                await msg.answer("Ошибка отправки SMS. Попробуйте позже.")
-                await state.clear()
-                return
+            await state.set_state(BookingStates.confirming_sms)
+            await msg.answer("Введите код из SMS для подтверждения записи:")
         else:
             await msg.answer("Ошибка отправки SMS. Попробуйте позже.")
             await state.clear()
             return
     else:
-        async with async_session() as db_session:
-            cooperator = await db_session.get(Cooperator, data["cooperator_id"])
-            service = await db_session.get(Service, data["service_id"])
-        cooperator_name = cooperator.name if cooperator else "Неизвестно"
-        service_name = service.name if service else "Неизвестно"
-        confirm_data = {
-            "cooperator_name": cooperator_name,
-            "service_name": service_name,
-            "datetime": data["datetime"],
-            "phone": phone,
-            "name": data["name"]
-        }
-        await state.update_data(confirm_data=confirm_data)
+        cooperator_name, service_name = await get_booking_names(data)
         confirm_text = (
             f"❓ <b>Точно хотите создать запись?</b>\n\n"
             f"🗓 <b>Дата:</b> {data['datetime']}\n"
@@ -510,19 +432,7 @@ async def check_sms_code(msg: Message, state: FSMContext) -> None:
     data = await state.get_data()
     code = msg.text.strip()
     if code == data["sms_code"]:
-        async with async_session() as db_session:
-            cooperator = await db_session.get(Cooperator, data["cooperator_id"])
-            service = await db_session.get(Service, data["service_id"])
-        cooperator_name = cooperator.name if cooperator else "Неизвестно"
-        service_name = service.name if service else "Неизвестно"
-        confirm_data = {
-            "cooperator_name": cooperator_name,
-            "service_name": service_name,
-            "datetime": data["datetime"],
-            "phone": data["phone"],
-            "name": data["name"]
-        }
-        await state.update_data(confirm_data=confirm_data)
+        cooperator_name, service_name = await get_booking_names(data)
         confirm_text = (
             f"❓ <b>Точно хотите создать запись?</b>\n\n"
             f"🗓 <b>Дата:</b> {data['datetime']}\n"
@@ -542,9 +452,8 @@ async def check_sms_code(msg: Message, state: FSMContext) -> None:
 async def confirm_create(msg: Message, state: FSMContext) -> None:
     log_func_call("confirm_create", f"user_id={msg.from_user.id}")
     data = await state.get_data()
-    confirm = data["confirm_data"]
+    cooperator_name, service_name = await get_booking_names(data)
     payload = {
-        "rk": RUBITIME_API_KEY,
         "branch_id": BRANCH_ID,
         "cooperator_id": data["cooperator_id"],
         "service_id": data["service_id"],
@@ -554,29 +463,29 @@ async def confirm_create(msg: Message, state: FSMContext) -> None:
         "phone": data["phone"]
     }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://rubitime.ru/api2/create-record", json=payload, timeout=10) as resp:
-                res = await resp.json()
-                if res.get("status") == "ok":
-                    await msg.answer(
-                        f"✅ <b>Запись создана!</b>\n"
-                        f"🗓 <b>Дата:</b> {confirm['datetime']}\n"
-                        f"👨‍⚕️ <b>Врач:</b> {confirm['cooperator_name']}\n"
-                        f"💼 <b>Услуга:</b> {confirm['service_name']}\n"
-                        f"👤 <b>Имя:</b> {confirm['name']}\n"
-                        f"📞 <b>Телефон:</b> {confirm['phone']}\n",
-                        reply_markup=get_lk_keyboard()
-                    )
-                    await save_reminder_record(
-                        user_id=msg.from_user.id,
-                        dt_str=data['datetime'],
-                        name=data['name'],
-                        phone=data['phone'],
-                        rubitime_id=res["data"]["id"],
-                        confirmed=True
-                    )
-                else:
-                    await msg.answer(f"❌ Ошибка: {res.get('message')}")
+        res = await rubitime_client.call("create-record", payload, priority=PRIORITY_USER)
+        if res.get("status") == "ok":
+            schedule_cache.invalidate(BRANCH_ID, data["cooperator_id"])
+            await msg.answer(
+                f"✅ <b>Запись создана!</b>\n"
+                f"🗓 <b>Дата:</b> {data['datetime']}\n"
+                f"👨‍⚕️ <b>Врач:</b> {cooperator_name}\n"
+                f"💼 <b>Услуга:</b> {service_name}\n"
+                f"👤 <b>Имя:</b> {data['name']}\n"
+                f"📞 <b>Телефон:</b> {data['phone']}\n",
+                reply_markup=get_lk_keyboard()
+            )
+            await save_reminder_record(
+                user_id=msg.from_user.id,
+                dt_str=data['datetime'],
+                name=data['name'],
+                phone=data['phone'],
+                rubitime_id=res["data"]["id"],
+                confirmed=True
+            )
+            await save_mirror(res["data"]["id"], {**payload, "user_id": msg.from_user.id})
+        else:
+            await msg.answer(f"❌ Ошибка: {res.get('message')}")
     except aiohttp.ClientError:
         await msg.answer("❌ Ошибка: не удалось связаться с сервером Rubitime. Попробуйте позже.")
     except asyncio.TimeoutError:
@@ -615,7 +524,7 @@ async def confirm_cancel_record(msg: Message, state: FSMContext) -> None:
     await state.set_state(BookingStates.confirming_cancel)
     await msg.answer(
         f"❓ <b>Точно хотите отменить запись?</b>\n"
-        f"🗓 <b>Дата:</b> {record[2].strftime('%Y-%m-%d %H:%M')}\n",
+        f"🗓 <b>Дата:</b> {record[2]}\n",
         reply_markup=get_confirm_keyboard()
     )
 
@@ -633,22 +542,21 @@ async def do_cancel_record(msg: Message, state: FSMContext) -> None:
 
     record_id, rubitime_id, dt = record
     payload = {
-        "rk": RUBITIME_API_KEY,
         "id": rubitime_id
     }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://rubitime.ru/api2/remove-record", json=payload, timeout=10) as resp:
-                res = await resp.json()
-                if res.get("status") == "ok":
-                    async with async_session() as db_session:
-                        rec = await db_session.get(ReminderRecord, record_id)
-                        if rec:
-                            await db_session.delete(rec)
-                            await db_session.commit()
-                    await msg.answer("✅ Запись успешно отменена.", reply_markup=get_lk_keyboard())
-                else:
-                    await msg.answer(f"❌ Ошибка отмены записи: {res.get('message')}")
+        res = await rubitime_client.call("remove-record", payload, priority=PRIORITY_USER)
+        if res.get("status") == "ok":
+            schedule_cache.invalidate(BRANCH_ID)
+            await save_mirror(rubitime_id, {}, removed=True)
+            async with async_session() as db_session:
+                rec = await db_session.get(ReminderRecord, record_id)
+                if rec:
+                    await db_session.delete(rec)
+                    await db_session.commit()
+            await msg.answer("✅ Запись успешно отменена.", reply_markup=get_lk_keyboard())
+        else:
+            await msg.answer(f"❌ Ошибка отмены записи: {res.get('message')}")
     except aiohttp.ClientError:
         await msg.answer("❌ Ошибка: не удалось связаться с сервером Rubitime. Попробуйте позже.")
     except asyncio.TimeoutError:
@@ -678,103 +586,99 @@ async def save_reminder_record(user_id: int, dt_str: str, name: str, phone: str,
             name=name,
             phone=phone,
             rubitime_id=rubitime_id,
-            confirmed=confirmed
+            confirmed=confirmed,
+            synced_at=datetime.datetime.now()
         )
         session.add(record)
-        await session.commit()
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Вебхук о создании успел сохранить эту запись раньше — дополняем её.
+            await session.rollback()
+            result = await session.execute(records_by_rubitime_id_query([rubitime_id]))
+            record = result.scalar_one()
+            record.user_id = user_id
+            record.confirmed = confirmed
+            record.synced_at = datetime.datetime.now()
+            await session.commit()
+    reminder_scheduler.schedule(record.id, dt, record.reminded_24h, record.reminded_12h)
 
 
 async def reminder_worker() -> None:
     """Фоновая задача для отправки напоминаний."""
     log_func_call("reminder_worker")
-    while True:
-        now = datetime.datetime.now()
-        async with async_session() as session:
-            records = await session.execute(
-                select(ReminderRecord)
-                .where(ReminderRecord.datetime > now)
-                .where(
-                    (
-                            (ReminderRecord.reminded_24h == False) &
-                            (ReminderRecord.datetime <= now + datetime.timedelta(hours=24)) &
-                            (ReminderRecord.datetime > now + datetime.timedelta(hours=12))
-                    )
-                    |
-                    (
-                            (ReminderRecord.reminded_12h == False) &
-                            (ReminderRecord.datetime <= now + datetime.timedelta(hours=12)) &
-                            (ReminderRecord.datetime > now)
-                    )
-                )
-            )
-            for rec in records.scalars():
-                delta = rec.datetime - now
-                if 24 * 3600 >= delta.total_seconds() > 12 * 3600 and not rec.reminded_24h:
-                    try:
-                        await bot.send_message(
-                            rec.user_id,
-                            f"⏰ Напоминание: ваша запись на {rec.datetime.strftime('%Y-%m-%d %H:%M')} через 24 часа."
-                        )
-                        rec.reminded_24h = True
-                    except Exception:
-                        pass
-                if 12 * 3600 >= delta.total_seconds() > 0 and not rec.reminded_12h:
-                    try:
-                        await bot.send_message(
-                            rec.user_id,
-                            f"⏰ Напоминание: ваша запись на {rec.datetime.strftime('%Y-%m-%d %H:%M')} через 12 часов."
-                        )
-                        rec.reminded_12h = True
-                    except Exception:
-                        pass
-            await session.commit()
-        await asyncio.sleep(600)
+    await reminder_scheduler.run(TelegramSender(bot))
 
 
 async def sync_records_with_rubitime() -> None:
     """Фоновая задача для синхронизации записей с Rubitime."""
     log_func_call("sync_records_with_rubitime")
+    reconciler = RecordReconciler(rubitime_client)
     while True:
-        now = datetime.datetime.now()
-        threshold_time = now - datetime.timedelta(minutes=5)
-        async with async_session() as session:
-            records = await session.execute(
-                select(ReminderRecord).where(
-                    ReminderRecord.datetime > now,
-                    ReminderRecord.confirmed == True,
-                    ReminderRecord.datetime <= threshold_time
-                )
-            )
-            recs = records.scalars().all()
-            for rec in recs:
-                payload = {
-                    "id": rec.rubitime_id,
-                    "rk": RUBITIME_API_KEY
-                }
-                try:
-                    async with aiohttp.ClientSession() as http_session:
-                        async with http_session.post("https://rubitime.ru/api2/get-record", json=payload,
-                                                     timeout=10) as resp:
-                            res = await resp.json()
-                            if res.get("status") == "error":
-                                await session.delete(rec)
-                                print(
-                                    f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] sync: deleted local record id={rec.id} (rubitime_id={rec.rubitime_id})"
-                                )
-                except Exception as e:
-                    print(
-                        f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] sync: error for record id={rec.id}: {e}"
-                    )
-            await session.commit()
-        await asyncio.sleep(60)
+        try:
+            await reconciler.run_pass()
+        except Exception as e:
+            log_func_call("sync_records_with_rubitime", f"error: {e}", level=logging.ERROR)
+        await asyncio.sleep(reconciler.pass_interval)
+
+
+async def supervise(name: str, worker: Callable[[], Awaitable[None]]) -> None:
+    """Выполняет фоновую задачу и перезапускает её после ошибки, не затрагивая остальные."""
+    while True:
+        try:
+            await worker()
+            log.error("worker stopped", extra={"worker": name})
+        except Exception:
+            log.exception("worker failed", extra={"worker": name})
+        await asyncio.sleep(WORKER_RESTART_DELAY)
+
+
+def start_workers() -> list[asyncio.Task]:
+    """Запускает фоновые задачи бота; выполняется только в одном процессе."""
+    workers = {
+        "reminders": reminder_worker,
+        "sync": sync_records_with_rubitime,
+        "archive": archive_worker,
+        "webhook_queue": webhook_consumer.run,
+    }
+    if isinstance(fsm_storage, SQLAlchemyStorage):
+        workers["fsm_cleanup"] = functools.partial(fsm_cleanup_worker, fsm_storage)
+    if SCHEDULE_PREFETCH_ENABLED:
+        prefetcher = SchedulePrefetcher(
+            schedule_cache, BRANCH_ID, functools.partial(fetch_schedule, priority=PRIORITY_PREFETCH)
+        )
+        workers["prefetch"] = prefetcher.run
+    return [asyncio.create_task(supervise(name, worker)) for name, worker in workers.items()]
+
+
+async def stop_workers(tasks: list[asyncio.Task]) -> None:
+    """Останавливает фоновые задачи."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def close_clients() -> None:
+    """Закрывает HTTP-сессии бота, Rubitime и SMS.ru."""
+    await rubitime_client.close()
+    await sms_dispatcher.close()
+    await bot.session.close()
 
 
 async def main() -> None:
     """Точка входа для запуска бота и фоновых задач."""
     log_func_call("main")
-    reminder_task = asyncio.create_task(reminder_worker())
-    sync_task = asyncio.create_task(sync_records_with_rubitime())
-    await dp.start_polling(bot)
+    await init_db()
+    tasks = start_workers()
+    # Снимок метрик процесса бота отдаёт /metrics веб-панели.
+    tasks.append(asyncio.create_task(metrics_writer("bot")))
+    try:
+        # Если раньше бот работал через вебхук, getUpdates без его удаления не работает.
+        await bot.delete_webhook()
+        await dp.start_polling(bot, close_bot_session=False)
+    finally:
+        await stop_workers(tasks)
+        await close_clients()
 
 
 if __name__ == "__main__":
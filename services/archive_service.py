@@ -0,0 +1,79 @@
+import asyncio
+import datetime
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import select, insert, delete, literal
+
+from services.logger import get_logger
+from static.models import ReminderRecord, ArchivedRecord, async_session, async_read_session
+
+load_dotenv()
+
+log = get_logger("archive")
+
+# Сколько дней прошедшая запись остаётся в рабочей таблице.
+RECORDS_RETENTION_DAYS = int(os.getenv("RECORDS_RETENTION_DAYS", "7"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+
+async def archive_past_records(retention_days: int = RECORDS_RETENTION_DAYS,
+                               batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Переносит прошедшие записи в архив порциями, возвращает число перенесённых."""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    total = 0
+    while True:
+        async with async_session() as session:
+            async with session.begin():
+                result = await session.execute(
+                    select(ReminderRecord.id)
+                    .where(ReminderRecord.datetime < cutoff)
+                    .order_by(ReminderRecord.datetime)
+                    .limit(batch_size)
+                )
+                ids = result.scalars().all()
+                if not ids:
+                    return total
+                source = select(
+                    ReminderRecord.id,
+                    *(getattr(ReminderRecord, name) for name in ArchivedRecord.COPIED_COLUMNS),
+                    literal(datetime.datetime.now(), ArchivedRecord.archived_at.type),
+                ).where(ReminderRecord.id.in_(ids))
+                await session.execute(
+                    insert(ArchivedRecord).from_select(
+                        ["record_id", *ArchivedRecord.COPIED_COLUMNS, "archived_at"], source
+                    )
+                )
+                await session.execute(delete(ReminderRecord).where(ReminderRecord.id.in_(ids)))
+        total += len(ids)
+        # Отдаём управление между порциями, чтобы не занимать базу и цикл событий надолго.
+        await asyncio.sleep(0)
+
+
+async def get_archived_records(user_id: int | None = None, date_from: datetime.datetime | None = None,
+                               date_to: datetime.datetime | None = None, limit: int = 100) -> list[ArchivedRecord]:
+    """Возвращает записи из архива (новые первыми) для истории в админ-панели."""
+    query = select(ArchivedRecord)
+    if user_id is not None:
+        query = query.where(ArchivedRecord.user_id == user_id)
+    if date_from is not None:
+        query = query.where(ArchivedRecord.datetime >= date_from)
+    if date_to is not None:
+        query = query.where(ArchivedRecord.datetime < date_to)
+    query = query.order_by(ArchivedRecord.datetime.desc(), ArchivedRecord.id.desc()).limit(limit)
+    async with async_read_session() as session:
+        result = await session.execute(query)
+        return result.scalars().all()
+
+
+async def archive_worker() -> None:
+    """Фоновая задача архивации прошедших записей."""
+    while True:
+        try:
+            moved = await archive_past_records()
+            if moved:
+                log.info("moved records", extra={"moved": moved})
+        except Exception:
+            log.exception("archive error")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
@@ -0,0 +1,12 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Настройки доставки обновлений Telegram; общие для бота и веб-панели, без импорта aiogram.
+# Способ получения обновлений Telegram: "polling" (python main.py) или "webhook" (через app.py).
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")
+TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram/webhook")
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
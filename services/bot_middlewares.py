@@ -0,0 +1,56 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+
+from services.metrics import registry
+from services.tracing import trace, span
+
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_seconds", "Время выполнения обработчиков бота", labels=("handler",))
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках бота", labels=("handler",))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время и ошибки каждого обработчика по имени его функции."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        name = getattr(data["handler"].callback, "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Внутренний middleware: трасса на обработку обновления с user_id, обработчиком и шагом FSM."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        with trace("bot.handler", user.id if user else None,
+                   handler=getattr(data["handler"].callback, "__name__", "unknown"),
+                   state=data.get("raw_state")) as current:
+            result = await handler(event, data)
+            if current is not None and "state" in data:
+                # Шаг после обработки нужен воронке: пользователь может уйти сразу после перехода.
+                with span("trace.next_state"):
+                    current.set(next_state=await data["state"].get_state())
+            return result
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: span на каждый запрос к Telegram Bot API внутри трассы."""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        with span("telegram", method=method.__api_method__):
+            return await make_request(bot, method)
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.metrics import registry
+from static.models import Cooperator, Service, CatalogVersion, async_read_session
+
+load_dotenv()
+
+# Как часто сверять версию справочника с базой, секунд.
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", "5"))
+# Полная перезагрузка, даже если версия не менялась (правки в обход приложения), секунд.
+CACHE_EXPIRED_TIMEOUT = int(os.getenv("CACHE_EXPIRED_TIMEOUT", "600"))
+
+
+@dataclass(frozen=True)
+class CooperatorInfo:
+    id: int
+    branch_id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class ServiceInfo:
+    id: int
+    branch_id: int
+    cooperator_id: int
+    name: str
+    price: float
+    duration: int
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Неизменяемый снимок справочника с индексами для поиска за O(1)."""
+    version: int
+    cooperators: tuple[CooperatorInfo, ...]
+    services: tuple[ServiceInfo, ...]
+    cooperators_by_id: dict[int, CooperatorInfo] = field(default_factory=dict)
+    services_by_id: dict[int, ServiceInfo] = field(default_factory=dict)
+    services_by_cooperator: dict[int, tuple[ServiceInfo, ...]] = field(default_factory=dict)
+    cooperators_by_branch: dict[int, tuple[CooperatorInfo, ...]] = field(default_factory=dict)
+    services_by_branch: dict[int, tuple[ServiceInfo, ...]] = field(default_factory=dict)
+    # Подписи кнопок клавиатур бота ("id: имя").
+    cooperator_buttons: tuple[str, ...] = ()
+    service_buttons: dict[int, tuple[str, ...]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, version: int, cooperators: list[CooperatorInfo], services: list[ServiceInfo]) -> "CatalogSnapshot":
+        def group(items, attr):
+            groups = defaultdict(list)
+            for item in items:
+                groups[getattr(item, attr)].append(item)
+            return {key: tuple(value) for key, value in groups.items()}
+
+        services_by_cooperator = group(services, "cooperator_id")
+        return cls(
+            version=version,
+            cooperators=tuple(cooperators),
+            services=tuple(services),
+            cooperators_by_id={c.id: c for c in cooperators},
+            services_by_id={s.id: s for s in services},
+            services_by_cooperator=services_by_cooperator,
+            cooperators_by_branch=group(cooperators, "branch_id"),
+            services_by_branch=group(services, "branch_id"),
+            cooperator_buttons=tuple(f"{c.id}: {c.name}" for c in cooperators),
+            service_buttons={
+                cooperator_id: tuple(f"{s.id}: {s.name}" for s in items)
+                for cooperator_id, items in services_by_cooperator.items()
+            },
+        )
+
+
+def paginate(items: tuple, search: str | None, field: str, after_id: int | None,
+             limit: int) -> tuple[tuple, int | None]:
+    """Страница элементов (упорядоченных по id) с префиксом search в поле field и id для следующей страницы."""
+    if search:
+        search = search.lower()
+        items = tuple(item for item in items if str(getattr(item, field)).lower().startswith(search))
+    start = 0 if after_id is None else bisect_right(items, after_id, key=lambda item: item.id)
+    page = items[start:start + limit]
+    return page, page[-1].id if page and start + limit < len(items) else None
+
+
+async def _read_version(session: AsyncSession) -> int:
+    return await session.scalar(select(CatalogVersion.version).where(CatalogVersion.id == 1)) or 0
+
+
+async def bump_catalog_version(session: AsyncSession) -> None:
+    """Увеличивает версию справочника в текущей транзакции изменения."""
+    result = await session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        session.add(CatalogVersion(id=1, version=1))
+
+
+class Catalog:
+    """Кэш справочника, общий для бота и веб-панели; сбрасывается по версии в БД."""
+
+    def __init__(self, check_interval: float = CATALOG_CHECK_INTERVAL, max_age: float = CACHE_EXPIRED_TIMEOUT):
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._snapshot: CatalogSnapshot | None = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        # Обращения, обслуженные без перечитывания справочника, и перечитывания.
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self) -> CatalogSnapshot:
+        """Возвращает актуальный снимок справочника."""
+        if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            self.hits += 1
+            return self._snapshot
+        async with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                self.hits += 1
+                return self._snapshot
+            async with async_read_session() as session:
+                version = await _read_version(session)
+                if self._snapshot is None or version != self._snapshot.version or now - self._loaded_at > self.max_age:
+                    self.misses += 1
+                    # Версия и строки читаются в одной транзакции — снимок согласован.
+                    cooperators = (await session.execute(select(Cooperator).order_by(Cooperator.id))).scalars()
+                    cooperators = [CooperatorInfo(c.id, c.branch_id, c.name) for c in cooperators]
+                    services = (await session.execute(select(Service).order_by(Service.id))).scalars()
+                    services = [
+                        ServiceInfo(s.id, s.branch_id, s.cooperator_id, s.name, s.price, s.duration)
+                        for s in services
+                    ]
+                    self._snapshot = CatalogSnapshot.build(version, cooperators, services)
+                    self._loaded_at = now
+                else:
+                    self.hits += 1
+            self._checked_at = now
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        """Заставляет следующий get() сверить версию с базой."""
+        self._checked_at = 0.0
+
+
+catalog = Catalog()
+registry.counter("catalog_cache_requests_total", "Обращения к кэшу справочника", labels=("result",),
+                 callback=lambda: {("hit",): catalog.hits, ("miss",): catalog.misses})
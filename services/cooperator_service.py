@@ -1,35 +1,19 @@
-import os
-import time
-
-from dotenv import load_dotenv
-from sqlalchemy import select
-
+from services.catalog import catalog, bump_catalog_version, paginate, CooperatorInfo
 from static.models import Cooperator, async_session
 
-load_dotenv()
-
-_cooperators_cache = {"value": None, "ts": 0}
-CACHE_EXPIRED_TIMEOUT = int(os.getenv("CACHE_EXPIRED_TIMEOUT"))
-
 
-def _cache_expired(ts, timeout=CACHE_EXPIRED_TIMEOUT):
-    return time.time() - ts > timeout
-
-
-async def get_cooperators(force_refresh=False):
-    if not force_refresh and _cooperators_cache["value"] is not None and not _cache_expired(_cooperators_cache["ts"]):
-        return _cooperators_cache["value"]
-    async with async_session() as session:
-        result = await session.execute(select(Cooperator))
-        cooperators = result.scalars().all()
-        _cooperators_cache["value"] = cooperators
-        _cooperators_cache["ts"] = time.time()
-        return cooperators
+async def get_cooperators(force_refresh=False) -> tuple[CooperatorInfo, ...]:
+    if force_refresh:
+        catalog.invalidate()
+    return (await catalog.get()).cooperators
 
 
-def clear_cooperators_cache():
-    _cooperators_cache["value"] = None
-    _cooperators_cache["ts"] = 0
+async def list_cooperators(branch_id: int | None = None, search: str | None = None, field: str = "name",
+                           after_id: int | None = None, limit: int = 100) -> tuple[tuple[CooperatorInfo, ...], int | None]:
+    """Страница сотрудников из кэша справочника и id для запроса следующей."""
+    snapshot = await catalog.get()
+    items = snapshot.cooperators if branch_id is None else snapshot.cooperators_by_branch.get(branch_id, ())
+    return paginate(items, search, field, after_id, limit)
 
 
 async def add_cooperator(id: int, branch_id: int, name: str):
@@ -40,5 +24,6 @@ async def add_cooperator(id: int, branch_id: int, name: str):
                 return False
             cooperator = Cooperator(id=id, branch_id=branch_id, name=name)
             session.add(cooperator)
-    clear_cooperators_cache()
+            await bump_catalog_version(session)
+    catalog.invalidate()
     return True
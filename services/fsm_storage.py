@@ -0,0 +1,122 @@
+import asyncio
+import datetime
+import json
+import os
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, case
+from sqlalchemy.dialects import sqlite, postgresql
+
+from services.logger import get_logger
+from static.models import FSMStateRecord, async_session, async_read_session
+
+load_dotenv()
+
+log = get_logger("fsm")
+
+# Где хранить состояния диалогов: "sql" — таблица fsm_states, "memory" — память процесса.
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sql").lower()
+# Через сколько секунд без активности брошенная запись считается истёкшей.
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "86400"))
+FSM_CLEANUP_INTERVAL = int(os.getenv("FSM_CLEANUP_INTERVAL", "3600"))
+
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+_EMPTY_DATA = "{}"
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """Хранилище FSM в базе проекта: переживает перезапуск и общее для нескольких процессов бота."""
+
+    def __init__(self, session_factory=async_session, read_session_factory=async_read_session,
+                 ttl: int = FSM_STATE_TTL, key_builder: KeyBuilder | None = None):
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.ttl = ttl
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    def _cutoff(self) -> datetime.datetime:
+        return datetime.datetime.now() - datetime.timedelta(seconds=self.ttl)
+
+    async def _upsert(self, key: StorageKey, state: str | None = None, data: str | None = None) -> None:
+        now = datetime.datetime.now()
+        # Истёкшая запись при обновлении одного поля не должна «воскрешать» второе.
+        expired = FSMStateRecord.updated_at < self._cutoff()
+        values = {
+            "state": case((expired, None), else_=FSMStateRecord.state),
+            "data": case((expired, _EMPTY_DATA), else_=FSMStateRecord.data),
+            "updated_at": now,
+        }
+        if state is not None or data is None:
+            values["state"] = state
+        if data is not None:
+            values["data"] = data
+        async with self.session_factory() as session:
+            async with session.begin():
+                insert = _UPSERTS[session.get_bind().dialect.name]
+                stmt = insert(FSMStateRecord).values(
+                    key=self.key_builder.build(key),
+                    state=state,
+                    data=data if data is not None else _EMPTY_DATA,
+                    updated_at=now,
+                )
+                await session.execute(stmt.on_conflict_do_update(index_elements=["key"], set_=values))
+
+    async def _get(self, key: StorageKey, column) -> Any:
+        async with self.read_session_factory() as session:
+            return await session.scalar(
+                select(column).where(
+                    FSMStateRecord.key == self.key_builder.build(key),
+                    FSMStateRecord.updated_at >= self._cutoff()
+                )
+            )
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._upsert(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self._get(key, FSMStateRecord.state)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._upsert(key, data=json.dumps(dict(data), ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        raw = await self._get(key, FSMStateRecord.data)
+        return json.loads(raw) if raw else {}
+
+    async def cleanup(self) -> int:
+        """Удаляет состояния брошенных диалогов, возвращает число удалённых."""
+        async with self.session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    delete(FSMStateRecord).where(FSMStateRecord.updated_at < self._cutoff())
+                )
+        return result.rowcount
+
+    async def close(self) -> None:
+        # Движком владеет static.models, закрывать здесь нечего.
+        pass
+
+
+def create_fsm_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """Создаёт хранилище FSM по настройке FSM_STORAGE."""
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sql":
+        return SQLAlchemyStorage()
+    raise ValueError(f"Unknown FSM_STORAGE: {kind}")
+
+
+async def fsm_cleanup_worker(storage: SQLAlchemyStorage) -> None:
+    """Фоновая задача удаления истёкших состояний FSM."""
+    while True:
+        try:
+            removed = await storage.cleanup()
+            if removed:
+                log.info("removed expired states", extra={"removed": removed})
+        except Exception:
+            log.exception("cleanup error")
+        await asyncio.sleep(FSM_CLEANUP_INTERVAL)
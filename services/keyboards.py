@@ -0,0 +1,90 @@
+from functools import lru_cache
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+from services.catalog import CatalogSnapshot
+
+DATES_PER_PAGE = 7
+NEXT_PAGE = "Вперед >>"
+PREV_PAGE = "<< Назад"
+
+# Клавиатуры общие для всех пользователей: собираются один раз и не изменяются.
+LK_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="🗂 Мои записи")],
+        [KeyboardButton(text="📝 Новая запись")],
+        [KeyboardButton(text="❌ Отмена записи")],
+    ],
+    resize_keyboard=True
+)
+
+CONFIRM_KEYBOARD = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="Да"), KeyboardButton(text="Нет")]
+    ],
+    resize_keyboard=True
+)
+
+
+def get_lk_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура личного кабинета."""
+    return LK_KEYBOARD
+
+
+def get_confirm_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура подтверждения."""
+    return CONFIRM_KEYBOARD
+
+
+def _list_keyboard(labels: tuple[str, ...]) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=label)] for label in labels],
+        resize_keyboard=True
+    )
+
+
+_catalog_keyboards: dict = {"version": None}
+
+
+def _catalog_keyboard(snapshot: CatalogSnapshot, key, labels: tuple[str, ...]) -> ReplyKeyboardMarkup:
+    if _catalog_keyboards["version"] != snapshot.version:
+        _catalog_keyboards.clear()
+        _catalog_keyboards["version"] = snapshot.version
+    kb = _catalog_keyboards.get(key)
+    if kb is None:
+        kb = _catalog_keyboards[key] = _list_keyboard(labels)
+    return kb
+
+
+def cooperators_keyboard(snapshot: CatalogSnapshot) -> ReplyKeyboardMarkup:
+    """Клавиатура выбора сотрудника, кэшируется до смены версии справочника."""
+    return _catalog_keyboard(snapshot, "cooperators", snapshot.cooperator_buttons)
+
+
+def services_keyboard(snapshot: CatalogSnapshot, cooperator_id: int) -> ReplyKeyboardMarkup:
+    """Клавиатура выбора услуги сотрудника, кэшируется до смены версии справочника."""
+    return _catalog_keyboard(
+        snapshot, ("services", cooperator_id), snapshot.service_buttons.get(cooperator_id, ())
+    )
+
+
+@lru_cache(maxsize=1024)
+def date_pages(dates: tuple[str, ...]) -> tuple[tuple[str, ...], ...]:
+    """Разбивает отсортированные даты на страницы."""
+    return tuple(dates[i:i + DATES_PER_PAGE] for i in range(0, len(dates), DATES_PER_PAGE))
+
+
+@lru_cache(maxsize=1024)
+def date_page_keyboard(dates: tuple[str, ...], page: int) -> ReplyKeyboardMarkup:
+    """Клавиатура страницы дат с кнопками навигации."""
+    pages = date_pages(dates)
+    current = pages[page] if page < len(pages) else ()
+    kb_buttons = [[KeyboardButton(text=date)] for date in current]
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(KeyboardButton(text=PREV_PAGE))
+    if page < len(pages) - 1:
+        nav_buttons.append(KeyboardButton(text=NEXT_PAGE))
+    if nav_buttons:
+        kb_buttons.append(nav_buttons)
+    return ReplyKeyboardMarkup(keyboard=kb_buttons, resize_keyboard=True)
@@ -0,0 +1,62 @@
+import asyncio
+import fcntl
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Файл блокировки: фоновые задачи бота запускает только процесс, который её держит.
+BOT_LEADER_LOCK_FILE = os.getenv("BOT_LEADER_LOCK_FILE", "bot_worker.lock")
+BOT_LEADER_RETRY_INTERVAL = float(os.getenv("BOT_LEADER_RETRY_INTERVAL", "30"))
+
+
+def configured_workers(argv: list[str] | None = None) -> int:
+    """Число воркеров uvicorn: --workers из командной строки или WEB_CONCURRENCY."""
+    argv = sys.argv if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg == "--workers" and i + 1 < len(argv):
+            return int(argv[i + 1])
+        if arg.startswith("--workers="):
+            return int(arg.partition("=")[2])
+    return int(os.getenv("WEB_CONCURRENCY", "1"))
+
+
+class LeaderLock:
+    """Межпроцессная блокировка на файле: один ведущий среди воркеров uvicorn."""
+
+    def __init__(self, path: str = BOT_LEADER_LOCK_FILE):
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Пытается стать ведущим без ожидания."""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    async def wait(self, interval: float = BOT_LEADER_RETRY_INTERVAL) -> None:
+        """Ждёт, пока ведущий процесс не освободит блокировку (например, упадёт)."""
+        while not self.try_acquire():
+            await asyncio.sleep(interval)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
@@ -0,0 +1,139 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" — одна JSON-строка на событие, "text" — прежний формат "[время] событие | подробности".
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Доля записываемых частых событий (попадания в кэш и т.п.), 0..1.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+# Сколько записей может ждать фоновой записи; при переполнении новые отбрасываются.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+ROOT_LOGGER = "rubitime"
+CALLS_LOGGER = f"{ROOT_LOGGER}.calls"
+# Стандартные атрибуты LogRecord; всё остальное — поля события из extra.
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample"}
+
+# Сколько записей отброшено из-за переполненной очереди.
+dropped = 0
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись как JSON-объект с полями события."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний формат print-логов: [время] сообщение | поля."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        ts = datetime.datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        # Для log_func_call выводим подробности как раньше: "[время] start called | user_id=1".
+        fields = ", ".join(
+            v if k == "extra" else f"{k}={v}"
+            for k, v in vars(record).items() if k not in _RESERVED and k != "func"
+        )
+        source = "" if record.name == CALLS_LOGGER else record.name.removeprefix(ROOT_LOGGER + ".") + ": "
+        line = f"[{ts}] {source}{record.getMessage()}"
+        if fields:
+            line += f" | {fields}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей с атрибутом sample (частые события), остальные — всегда."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample", None)
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Кладёт запись в ограниченную очередь, не блокируя цикл событий; при переполнении отбрасывает."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование и сериализация — в потоке записи; здесь только фиксируем сообщение.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> logging.Logger:
+    """Настраивает логгер проекта: очередь в цикле событий, запись в stdout в отдельном потоке."""
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER)
+    if _listener is not None:
+        return root
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter())
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return root
+
+
+def shutdown_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+_calls = get_logger(CALLS_LOGGER.removeprefix(ROOT_LOGGER + "."))
+
+
+def log_func_call(func_name: str, extra: str | None = None, level: int = logging.INFO,
+                  sample: float | None = None) -> None:
+    """Логирует вызов функции; частые вызовы можно прореживать через sample."""
+    if not _calls.isEnabledFor(level):
+        return
+    fields = {"func": func_name}
+    if extra:
+        fields["extra"] = extra
+    if sample is not None:
+        fields["sample"] = sample
+    _calls.log(level, "%s called", func_name, extra=fields)
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from dotenv import load_dotenv
+
+from services.logger import get_logger
+
+load_dotenv()
+
+# Каталог, через который процессы (бот, воркеры веб-панели) делятся метриками с /metrics.
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "15"))
+# Снимки процессов, не обновлявшиеся дольше, считаются оставшимися от остановленных процессов.
+METRICS_STALE_AFTER = METRICS_FLUSH_INTERVAL * 4
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+log = get_logger("metrics")
+
+
+class Metric:
+    """Метрика с метками; значения хранятся по кортежу значений меток."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 callback: Callable[[], float | dict[tuple, float]] | None = None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # Значение, вычисляемое при сборе (размер очереди, счётчики других модулей).
+        self.callback = callback
+        self._values: dict[tuple, float] = {}
+
+    def _collect(self) -> dict[tuple, float]:
+        if self.callback is None:
+            return self._values
+        value = self.callback()
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        return [("", dict(zip(self.labels, key)), value) for key, value in self._collect().items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, value: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # метки -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._hist: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._hist.get(labels)
+        if entry is None:
+            entry = self._hist[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> list[tuple[str, dict, float]]:
+        result = []
+        for key, (counts, total) in self._hist.items():
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                result.append(("_bucket", {**labels, "le": le}, cumulative))
+            result.append(("_sum", labels, total))
+            result.append(("_count", labels, cumulative))
+        return result
+
+
+class Registry:
+    """Набор метрик процесса; повторная регистрация имени возвращает уже созданную метрику."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def _register(self, cls, name: str, help: str, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str, **kwargs) -> Counter:
+        return self._register(Counter, name, help, **kwargs)
+
+    def gauge(self, name: str, help: str, **kwargs) -> Gauge:
+        return self._register(Gauge, name, help, **kwargs)
+
+    def histogram(self, name: str, help: str, **kwargs) -> Histogram:
+        return self._register(Histogram, name, help, **kwargs)
+
+    def snapshot(self) -> dict:
+        """Текущие значения всех метрик в виде, пригодном для JSON."""
+        result = {}
+        for metric in self._metrics.values():
+            try:
+                samples = metric.samples()
+            except Exception:
+                log.exception("collect failed", extra={"metric": metric.name})
+                continue
+            result[metric.name] = {"kind": metric.kind, "help": metric.help, "samples": samples}
+        return result
+
+
+registry = Registry()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(snapshots: dict[str, dict]) -> str:
+    """Формат экспозиции Prometheus; каждая серия получает метку process."""
+    families: dict[str, tuple[str, str, list]] = {}
+    for process, snapshot in snapshots.items():
+        for name, family in snapshot.items():
+            entry = families.setdefault(name, (family["kind"], family["help"], []))
+            entry[2].extend((suffix, {**labels, "process": process}, value) for suffix, labels, value in family["samples"])
+    lines = []
+    for name, (kind, help, samples) in sorted(families.items()):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{suffix}{{{label_str}}} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+def _snapshot_path(process: str) -> str:
+    return os.path.join(METRICS_DIR, f"{process}.json")
+
+
+def _write(path: str, snapshot: dict) -> None:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def _read_others(own: str) -> dict[str, dict]:
+    result = {}
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        return result
+    now = time.time()
+    for name in names:
+        process, ext = os.path.splitext(name)
+        if ext != ".json" or process == own:
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > METRICS_STALE_AFTER:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                result[process] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return result
+
+
+def process_name(role: str) -> str:
+    return f"{role}-{os.getpid()}"
+
+
+async def collect(role: str) -> str:
+    """Метрики этого процесса и свежие снимки остальных в формате Prometheus."""
+    own = process_name(role)
+    snapshots = await asyncio.to_thread(_read_others, own)
+    snapshots[own] = registry.snapshot()
+    return render(snapshots)
+
+
+async def metrics_writer(role: str) -> None:
+    """Фоновая задача: периодически сохраняет снимок метрик процесса для /metrics."""
+    path = _snapshot_path(process_name(role))
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(_write, path, registry.snapshot())
+            except Exception:
+                log.exception("snapshot write failed")
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,82 @@
+import datetime
+import json
+from typing import Any
+
+from sqlalchemy import func
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from static.models import RubitimeRecord, async_session
+
+_UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+_FIELDS = ("branch_id", "cooperator_id", "service_id", "status", "record", "name", "phone", "price", "user_id")
+
+
+def _int(value: Any) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value: Any) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _datetime(value: Any) -> datetime.datetime | None:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def mirror_values(data: dict) -> dict:
+    """Разбирает данные записи Rubitime (вебхук или get-record) в колонки зеркала."""
+    return {
+        "branch_id": _int(data.get("branch_id")),
+        "cooperator_id": _int(data.get("cooperator_id")),
+        "service_id": _int(data.get("service_id")),
+        "status": _int(data.get("status")),
+        "record": _datetime(data.get("record")),
+        "name": data.get("name") or None,
+        "phone": data.get("phone") or None,
+        "price": _float(data.get("price")),
+        "user_id": _int(data.get("user_id")),
+    }
+
+
+async def upsert_mirror(session: AsyncSession, rubitime_id: int, data: dict, version: float,
+                        removed: bool = False) -> None:
+    """Записывает состояние записи в зеркало в текущей транзакции."""
+    # Старая версия не перезаписывает новую, удаление окончательно, пропущенные поля сохраняются.
+    now = datetime.datetime.now()
+    insert = _UPSERTS[session.get_bind().dialect.name]
+    stmt = insert(RubitimeRecord).values(
+        id=rubitime_id,
+        data=json.dumps(data, ensure_ascii=False, default=str),
+        version=version,
+        synced_at=now,
+        removed_at=now if removed else None,
+        **mirror_values(data)
+    )
+    excluded = stmt.excluded
+    values = {name: func.coalesce(excluded[name], RubitimeRecord.__table__.c[name]) for name in _FIELDS}
+    values.update(data=excluded.data, version=excluded.version, synced_at=excluded.synced_at,
+                  removed_at=excluded.removed_at)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_=values,
+        where=(RubitimeRecord.removed_at == None) & (RubitimeRecord.version <= excluded.version)
+    ))
+
+
+async def save_mirror(rubitime_id: int, data: dict, removed: bool = False) -> None:
+    """Обновляет зеркало в отдельной транзакции (после действий бота в Rubitime)."""
+    async with async_session() as session:
+        async with session.begin():
+            await upsert_mirror(session, rubitime_id, data, datetime.datetime.now().timestamp(), removed)
@@ -0,0 +1,80 @@
+import datetime
+
+from sqlalchemy import Select, select, tuple_
+
+from static.models import ReminderRecord, RubitimeRecord, async_read_session
+
+
+def encode_cursor(record: ReminderRecord) -> str:
+    """Курсор страницы: время и id последней отданной записи."""
+    return f"{record.datetime.isoformat()}_{record.id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    """Разбирает курсор encode_cursor; при неверном формате — ValueError."""
+    moment, _, record_id = cursor.rpartition("_")
+    return datetime.datetime.fromisoformat(moment), int(record_id)
+
+
+def user_records_query(user_id: int) -> Select:
+    """Записи пользователя с копией из Rubitime («Мои записи»)."""
+    return (
+        select(ReminderRecord, RubitimeRecord)
+        .outerjoin(RubitimeRecord, RubitimeRecord.id == ReminderRecord.rubitime_id)
+        .where(ReminderRecord.user_id == user_id)
+    )
+
+
+def user_reminders_query(user_id: int) -> Select:
+    """Записи пользователя (отмена записи)."""
+    return select(ReminderRecord).where(ReminderRecord.user_id == user_id)
+
+
+def user_record_at_query(user_id: int, dt: datetime.datetime) -> Select:
+    """Запись пользователя на это время (проверка занятости перед созданием)."""
+    return select(ReminderRecord).where(ReminderRecord.user_id == user_id, ReminderRecord.datetime == dt)
+
+
+def records_by_rubitime_id_query(rubitime_ids: list[int]) -> Select:
+    """Записи по идентификаторам Rubitime (вебхуки и дополнение записи, созданной вебхуком)."""
+    return select(ReminderRecord).where(ReminderRecord.rubitime_id.in_(rubitime_ids))
+
+
+def records_query(user_id: int | None = None, branch_id: int | None = None, cooperator_id: int | None = None,
+                  date_from: datetime.datetime | None = None, date_to: datetime.datetime | None = None,
+                  after: tuple[datetime.datetime, int] | None = None, limit: int = 50) -> Select:
+    """Страница записей для админ-панели (на одну строку больше limit)."""
+    query = select(ReminderRecord, RubitimeRecord)
+    if branch_id is not None or cooperator_id is not None:
+        query = query.join(RubitimeRecord, RubitimeRecord.id == ReminderRecord.rubitime_id)
+        if branch_id is not None:
+            query = query.where(RubitimeRecord.branch_id == branch_id)
+        if cooperator_id is not None:
+            query = query.where(RubitimeRecord.cooperator_id == cooperator_id)
+    else:
+        query = query.outerjoin(RubitimeRecord, RubitimeRecord.id == ReminderRecord.rubitime_id)
+    if user_id is not None:
+        query = query.where(ReminderRecord.user_id == user_id)
+    if date_from is not None:
+        query = query.where(ReminderRecord.datetime >= date_from)
+    if date_to is not None:
+        query = query.where(ReminderRecord.datetime < date_to)
+    if after is not None:
+        # Keyset вместо OFFSET: страница читается по индексу с места, где закончилась предыдущая.
+        query = query.where(tuple_(ReminderRecord.datetime, ReminderRecord.id) > tuple_(*after))
+    # На одну строку больше, чтобы узнать, есть ли следующая страница.
+    return query.order_by(ReminderRecord.datetime, ReminderRecord.id).limit(limit + 1)
+
+
+async def list_records(user_id: int | None = None, branch_id: int | None = None, cooperator_id: int | None = None,
+                       date_from: datetime.datetime | None = None, date_to: datetime.datetime | None = None,
+                       after: tuple[datetime.datetime, int] | None = None, limit: int = 50
+                       ) -> tuple[list[tuple[ReminderRecord, RubitimeRecord | None]], str | None]:
+    """Страница записей по времени (с копией из Rubitime) и курсор следующей страницы."""
+    query = records_query(user_id, branch_id, cooperator_id, date_from, date_to, after, limit)
+    async with async_read_session() as session:
+        rows = (await session.execute(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1][0])
+    return rows, None
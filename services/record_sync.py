@@ -0,0 +1,165 @@
+import datetime
+import os
+import re
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import Select, select, update, delete
+
+from services.logger import get_logger
+from services.record_mirror import upsert_mirror
+from services.reminder_scheduler import reminder_scheduler
+from services.rubitime_client import RubitimeClient, PRIORITY_BACKGROUND, RUBITIME_RATE_INTERVAL
+from services.webhook_dedup import event_version
+from static.models import ReminderRecord, RubitimeRecord, async_session, async_read_session
+
+load_dotenv()
+
+SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "60"))
+# Доля лимита Rubitime API, которую может занимать сверка записей.
+SYNC_RATE_SHARE = float(os.getenv("SYNC_RATE_SHARE", "0.5"))
+# Записи, подтверждённые вебхуком или сверкой недавно, не проверяются, секунд.
+SYNC_GRACE_PERIOD = int(os.getenv("SYNC_GRACE_PERIOD", "300"))
+# Сообщение get-record, означающее, что записи в Rubitime нет. Любая другая ошибка (ключ API,
+# лимит, временный сбой) — не повод удалять запись: её удаление необратимо.
+SYNC_NOT_FOUND_PATTERN = re.compile(os.getenv("SYNC_NOT_FOUND_PATTERN", r"не найден|not found"), re.IGNORECASE)
+
+# Как часто перепроверять запись в зависимости от того, сколько осталось до визита.
+CHECK_INTERVALS = (
+    (datetime.timedelta(hours=24), datetime.timedelta(minutes=15)),
+    (datetime.timedelta(days=7), datetime.timedelta(hours=2)),
+)
+DEFAULT_CHECK_INTERVAL = datetime.timedelta(hours=12)
+
+
+def check_interval(time_left: datetime.timedelta) -> datetime.timedelta:
+    """Возвращает желаемый период проверки записи."""
+    for horizon, interval in CHECK_INTERVALS:
+        if time_left <= horizon:
+            return interval
+    return DEFAULT_CHECK_INTERVAL
+
+
+log = get_logger("sync")
+
+
+def select_due_query(now: datetime.datetime, checked_before: datetime.datetime) -> Select:
+    """Будущие подтверждённые записи, не сверявшиеся с checked_before, с отметкой зеркала."""
+    return (
+        select(ReminderRecord.id, ReminderRecord.rubitime_id, ReminderRecord.datetime,
+               ReminderRecord.synced_at, RubitimeRecord.id, RubitimeRecord.synced_at)
+        .outerjoin(RubitimeRecord, RubitimeRecord.id == ReminderRecord.rubitime_id)
+        .where(
+            ReminderRecord.datetime > now,
+            ReminderRecord.confirmed == True,
+            (ReminderRecord.synced_at == None) | (ReminderRecord.synced_at <= checked_before)
+        )
+    )
+
+
+class RecordReconciler:
+    """Сверяет локальные записи с Rubitime порциями в пределах лимита API."""
+
+    def __init__(self, client: RubitimeClient, pass_interval: int = SYNC_INTERVAL,
+                 rate_share: float = SYNC_RATE_SHARE, grace_period: int = SYNC_GRACE_PERIOD):
+        self.client = client
+        self.pass_interval = pass_interval
+        self.grace_period = datetime.timedelta(seconds=grace_period)
+        self.batch_size = max(1, int(pass_interval / RUBITIME_RATE_INTERVAL * rate_share))
+        self.stats = {"checked": 0, "removed": 0, "errors": 0, "backlog": 0, "duration": 0.0}
+
+    async def select_due(self, now: datetime.datetime) -> tuple[list[tuple[int, int, datetime.datetime]], int]:
+        """Возвращает самые срочные записи для проверки и общий размер очереди."""
+        async with async_read_session() as session:
+            result = await session.execute(select_due_query(now, now - self.grace_period))
+            rows = result.all()
+        due = []
+        for record_id, rubitime_id, dt, synced_at, mirrored, mirror_synced_at in rows:
+            interval = check_interval(dt - now)
+            if mirrored is None:
+                # Записи ещё нет в зеркале — догружаем её первой.
+                due.append((float("inf"), dt, record_id, rubitime_id))
+                continue
+            # Свежесть — по последнему вебхуку или проверке, попавшим в зеркало или в саму запись.
+            synced_at = max(filter(None, (synced_at, mirror_synced_at)), default=None)
+            staleness = now - synced_at if synced_at else interval * 10
+            if staleness < interval:
+                continue
+            # Чем дольше запись не проверялась относительно своего периода, тем выше приоритет.
+            due.append((staleness / interval, dt, record_id, rubitime_id))
+        due.sort(key=lambda item: (-item[0], item[1]))
+        return [(record_id, rubitime_id, dt) for _, dt, record_id, rubitime_id in due[:self.batch_size]], len(due)
+
+    async def run_pass(self) -> dict:
+        """Выполняет один проход сверки."""
+        started = time.monotonic()
+        now = datetime.datetime.now()
+        batch, backlog = await self.select_due(now)
+        removed, confirmed, moved, errors = [], [], {}, 0
+        fetched: dict[int, dict | None] = {}
+        for record_id, rubitime_id, dt in batch:
+            try:
+                res = await self.client.call("get-record", {"id": rubitime_id}, priority=PRIORITY_BACKGROUND)
+            except Exception as e:
+                errors += 1
+                log.warning("check failed: %s", e, extra={"record_id": record_id})
+                continue
+            if res.get("status") == "error":
+                if not SYNC_NOT_FOUND_PATTERN.search(str(res.get("message") or "")):
+                    errors += 1
+                    log.warning("check failed: %s", res.get("message"), extra={"record_id": record_id})
+                    continue
+                removed.append(record_id)
+                fetched[rubitime_id] = None
+                log.info("deleted local record", extra={"record_id": record_id, "rubitime_id": rubitime_id})
+                continue
+            confirmed.append(record_id)
+            fetched[rubitime_id] = res.get("data") or {}
+            try:
+                remote_dt = datetime.datetime.strptime(res["data"]["record"], "%Y-%m-%d %H:%M:%S")
+                if remote_dt != dt:
+                    moved[record_id] = remote_dt
+            except Exception:
+                pass
+        to_schedule = []
+        if removed or confirmed:
+            async with async_session() as session:
+                if removed:
+                    await session.execute(delete(ReminderRecord).where(ReminderRecord.id.in_(removed)))
+                if confirmed:
+                    await session.execute(
+                        update(ReminderRecord)
+                        .where(ReminderRecord.id.in_(confirmed))
+                        .values(synced_at=datetime.datetime.now())
+                    )
+                for record_id, remote_dt in moved.items():
+                    await session.execute(
+                        update(ReminderRecord).where(ReminderRecord.id == record_id).values(datetime=remote_dt)
+                    )
+                if moved:
+                    result = await session.execute(
+                        select(ReminderRecord.id, ReminderRecord.datetime,
+                               ReminderRecord.reminded_24h, ReminderRecord.reminded_12h)
+                        .where(ReminderRecord.id.in_(list(moved)))
+                    )
+                    to_schedule = result.all()
+                for rubitime_id, data in fetched.items():
+                    version = event_version(data or {}, now)
+                    await upsert_mirror(session, rubitime_id, data or {}, version, removed=data is None)
+                await session.commit()
+        # Перенесённым записям — напоминания к новому времени, не дожидаясь пересинхронизации.
+        for record_id, dt, reminded_24h, reminded_12h in to_schedule:
+            reminder_scheduler.schedule(record_id, dt, bool(reminded_24h), bool(reminded_12h))
+        duration = time.monotonic() - started
+        self.stats = {
+            "checked": len(batch),
+            "removed": len(removed),
+            "errors": errors,
+            "backlog": backlog - len(batch),
+            "duration": duration,
+        }
+        if batch:
+            log.info("pass done", extra={
+                **self.stats, "throughput": round(len(batch) / duration, 2) if duration else 0.0,
+            })
+        return self.stats
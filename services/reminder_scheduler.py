@@ -0,0 +1,220 @@
+import asyncio
+import datetime
+import heapq
+import os
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+from sqlalchemy import Select, select, update
+
+from services.logger import get_logger
+from services.metrics import registry, LAG_BUCKETS
+from static.models import ReminderRecord, async_session, async_read_session
+
+if TYPE_CHECKING:
+    # Рассылка (и aiogram) нужна только процессу бота; веб-панели планировщик нужен ради schedule().
+    from services.telegram_sender import TelegramSender
+
+load_dotenv()
+
+# Период полной пересинхронизации очереди с базой (страховка от пропущенных событий), секунд.
+REMINDER_RESYNC_INTERVAL = int(os.getenv("REMINDER_RESYNC_INTERVAL", "900"))
+# Через сколько секунд повторить напоминание, не доставленное из-за временной ошибки.
+REMINDER_RETRY_DELAY = int(os.getenv("REMINDER_RETRY_DELAY", "60"))
+
+log = get_logger("reminders")
+
+REMINDER_LAG = registry.histogram(
+    "reminder_lag_seconds", "Задержка отправки напоминания от начала его окна", labels=("kind",), buckets=LAG_BUCKETS)
+REMINDERS_SENT = registry.counter("reminders_total", "Напоминания по результату отправки", labels=("kind", "status"))
+
+# (флаг в ReminderRecord, за сколько до визита напоминать, текст)
+REMINDERS = {
+    "reminded_24h": (datetime.timedelta(hours=24), "через 24 часа."),
+    "reminded_12h": (datetime.timedelta(hours=12), "через 12 часов."),
+}
+
+
+def reminder_window(kind: str, dt: datetime.datetime) -> tuple[datetime.datetime, datetime.datetime]:
+    """Возвращает интервал [начало, конец), в котором напоминание kind ещё актуально."""
+    ahead, _ = REMINDERS[kind]
+    shorter = [other for other, _ in REMINDERS.values() if other < ahead]
+    return dt - ahead, dt - max(shorter, default=datetime.timedelta(0))
+
+
+def reminder_text(kind: str, dt: datetime.datetime) -> str:
+    return f"⏰ Напоминание: ваша запись на {dt.strftime('%Y-%m-%d %H:%M')} {REMINDERS[kind][1]}"
+
+
+def resync_query(now: datetime.datetime, horizon: datetime.datetime) -> Select:
+    """Записи, по которым до horizon ещё нужно отправить напоминания."""
+    return select(
+        ReminderRecord.id, ReminderRecord.datetime, ReminderRecord.reminded_24h, ReminderRecord.reminded_12h
+    ).where(
+        ReminderRecord.datetime > now,
+        ReminderRecord.datetime <= horizon,
+        # После 12-часового напоминания отправлять по записи больше нечего.
+        ReminderRecord.reminded_12h == False
+    )
+
+
+class ReminderScheduler:
+    """Очередь напоминаний на куче: спит ровно до ближайшего срока."""
+
+    def __init__(self, resync_interval: int = REMINDER_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self._heap: list[tuple[datetime.datetime, int, str, datetime.datetime]] = []
+        # (record_id, вид) -> (срок, время визита): действующая запись; остальные элементы кучи устарели.
+        self._pending: dict[tuple[int, str], tuple[datetime.datetime, datetime.datetime]] = {}
+        # Ключи, изменённые schedule() во время запроса resync(), — они новее прочитанного из базы.
+        self._touched: set[tuple[int, str]] | None = None
+        self._wakeup = asyncio.Event()
+        self._running = False
+
+    @staticmethod
+    def _entries(record_id: int, dt: datetime.datetime, reminded_24h: bool, reminded_12h: bool,
+                 now: datetime.datetime) -> dict[tuple[int, str], tuple[datetime.datetime, datetime.datetime] | None]:
+        """Сроки напоминаний по записи; None — напоминание уже не нужно."""
+        flags = {"reminded_24h": reminded_24h, "reminded_12h": reminded_12h}
+        entries = {}
+        for kind in REMINDERS:
+            start, end = reminder_window(kind, dt)
+            entries[(record_id, kind)] = (start, dt) if not flags[kind] and end > now else None
+        return entries
+
+    def _push(self, key: tuple[int, str], start: datetime.datetime, dt: datetime.datetime) -> None:
+        self._pending[key] = (start, dt)
+        heapq.heappush(self._heap, (start, key[0], key[1], dt))
+
+    def schedule(self, record_id: int, dt: datetime.datetime,
+                 reminded_24h: bool = False, reminded_12h: bool = False) -> None:
+        """Добавляет напоминания по записи в очередь, заменяя запланированные ранее."""
+        if not self._running:
+            return
+        head = self._heap[0][0] if self._heap else None
+        for key, entry in self._entries(record_id, dt, reminded_24h, reminded_12h, datetime.datetime.now()).items():
+            if self._touched is not None:
+                self._touched.add(key)
+            if entry is None:
+                self._pending.pop(key, None)
+            elif self._pending.get(key) != entry:
+                self._push(key, *entry)
+        if self._heap and (head is None or self._heap[0][0] < head):
+            self._wakeup.set()
+
+    async def resync(self) -> None:
+        """Перестраивает очередь по базе для записей, срок которых наступит до следующей синхронизации."""
+        now = datetime.datetime.now()
+        horizon = now + max(ahead for ahead, _ in REMINDERS.values()) + datetime.timedelta(
+            seconds=self.resync_interval * 2)
+        self._touched = set()
+        try:
+            async with async_read_session() as session:
+                result = await session.execute(resync_query(now, horizon))
+                rows = result.all()
+        finally:
+            touched, self._touched = self._touched, None
+        pending = {}
+        for record_id, dt, reminded_24h, reminded_12h in rows:
+            for key, entry in self._entries(record_id, dt, bool(reminded_24h), bool(reminded_12h), now).items():
+                old = self._pending.get(key)
+                if entry is not None:
+                    # Отложенный повтор после ошибки отправки сохраняет свой срок.
+                    pending[key] = old if old and old[1] == entry[1] and old[0] > entry[0] else entry
+        # Запланированное во время запроса новее снимка базы.
+        for key in touched:
+            if key in self._pending:
+                pending[key] = self._pending[key]
+            else:
+                pending.pop(key, None)
+        self._pending = pending
+        self._heap = [(start, record_id, kind, dt) for (record_id, kind), (start, dt) in pending.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_due(self, now: datetime.datetime) -> list[tuple[int, str, datetime.datetime]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            start, record_id, kind, dt = heapq.heappop(self._heap)
+            # Элементы, заменённые повторным schedule(), пропускаем.
+            if self._pending.get((record_id, kind)) == (start, dt):
+                del self._pending[(record_id, kind)]
+                due.append((record_id, kind, dt))
+        return due
+
+    async def _fire(self, due: list[tuple[int, str, datetime.datetime]], sender: "TelegramSender") -> None:
+        from services.telegram_sender import FAILED
+        now = datetime.datetime.now()
+        async with async_read_session() as session:
+            result = await session.execute(
+                select(ReminderRecord).where(ReminderRecord.id.in_({record_id for record_id, _, _ in due}))
+            )
+            records = {rec.id: rec for rec in result.scalars()}
+        batch = []
+        for record_id, kind, dt in due:
+            rec = records.get(record_id)
+            # Запись удалена, перенесена или напоминание уже отправлено — пропускаем.
+            if rec is None or rec.datetime != dt or getattr(rec, kind):
+                continue
+            start, end = reminder_window(kind, rec.datetime)
+            if start <= now < end:
+                batch.append((rec, kind))
+        if not batch:
+            return
+        # Рассылаем без открытой сессии БД, флаги фиксируем одной транзакцией после отправки.
+        results = await sender.send_many([(rec.user_id, reminder_text(kind, rec.datetime)) for rec, kind in batch])
+        done = {kind: [] for kind in REMINDERS}
+        sent_at = datetime.datetime.now()
+        retry_at = sent_at + datetime.timedelta(seconds=REMINDER_RETRY_DELAY)
+        for (rec, kind), status in zip(batch, results):
+            REMINDERS_SENT.inc(kind, status)
+            if status != FAILED:
+                REMINDER_LAG.observe((sent_at - reminder_window(kind, rec.datetime)[0]).total_seconds(), kind)
+            if status == FAILED:
+                self._push((rec.id, kind), retry_at, rec.datetime)
+            else:
+                done[kind].append(rec.id)
+        async with async_session() as session:
+            for kind, ids in done.items():
+                if ids:
+                    await session.execute(
+                        update(ReminderRecord)
+                        .where(ReminderRecord.id.in_(ids), getattr(ReminderRecord, kind) == False)
+                        .values({kind: True})
+                    )
+            await session.commit()
+
+    async def run(self, sender: "TelegramSender") -> None:
+        self._running = True
+        loop = asyncio.get_running_loop()
+        next_resync = 0.0
+        try:
+            while True:
+                if loop.time() >= next_resync:
+                    try:
+                        await self.resync()
+                        next_resync = loop.time() + self.resync_interval
+                    except Exception:
+                        log.exception("resync failed")
+                        next_resync = loop.time() + REMINDER_RETRY_DELAY
+                self._wakeup.clear()
+                due = self._pop_due(datetime.datetime.now())
+                if due:
+                    try:
+                        await self._fire(due, sender)
+                    except Exception:
+                        # Неотправленные напоминания вернёт из базы досрочная пересинхронизация.
+                        log.exception("reminders failed", extra={"count": len(due)})
+                        next_resync = min(next_resync, loop.time() + REMINDER_RETRY_DELAY)
+                    continue
+                timeout = next_resync - loop.time()
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - datetime.datetime.now()).total_seconds())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._running = False
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,146 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from services.metrics import registry
+from services.tracing import span
+
+load_dotenv()
+
+RUBITIME_API_KEY = os.getenv("RUBITIME_API_KEY")
+# Базовый адрес API; для нагрузочных тестов можно указать локальный simulator.py.
+RUBITIME_API_URL = os.getenv("RUBITIME_API_URL", "https://rubitime.ru/api2/").rstrip("/") + "/"
+# По документации Rubitime: не чаще одного запроса в 5 секунд.
+RUBITIME_RATE_INTERVAL = float(os.getenv("RUBITIME_RATE_INTERVAL", "5"))
+RUBITIME_RATE_BURST = int(os.getenv("RUBITIME_RATE_BURST", "1"))
+RUBITIME_TIMEOUT = float(os.getenv("RUBITIME_TIMEOUT", "10"))
+
+# Чем меньше значение, тем раньше запрос получит слот.
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 10
+PRIORITY_PREFETCH = 20
+
+
+RUBITIME_LATENCY = registry.histogram(
+    "rubitime_request_seconds", "Время ответа Rubitime API (без ожидания лимита)", labels=("method",))
+RUBITIME_REQUESTS = registry.counter(
+    "rubitime_requests_total", "Запросы к Rubitime API по результату", labels=("method", "result"))
+RUBITIME_LIMITER_WAIT = registry.histogram(
+    "rubitime_limiter_wait_seconds", "Ожидание токена лимитера Rubitime", labels=("priority",))
+
+
+class PriorityTokenBucket:
+    """Token bucket, выдающий токены ожидающим в порядке приоритета."""
+
+    def __init__(self, interval: float, burst: int = 1):
+        self.interval = interval
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.interval > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+        else:
+            self._tokens = float(self.burst)
+        self._updated = now
+
+    async def acquire(self, priority: int = PRIORITY_BACKGROUND) -> None:
+        """Ждёт свободный токен; запросы с меньшим priority обслуживаются первыми."""
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._schedule()
+        await fut
+
+    def _schedule(self) -> None:
+        if self._timer is not None or not self._waiters:
+            return
+        delay = max(0.0, (1 - self._tokens) * self.interval)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self) -> None:
+        self._timer = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self._tokens -= 1
+            fut.set_result(None)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        self._schedule()
+
+
+class RubitimeClient:
+    """Долгоживущий клиент Rubitime API с общим пулом соединений и лимитом запросов."""
+
+    def __init__(self, api_key: str | None, base_url: str = RUBITIME_API_URL,
+                 interval: float = RUBITIME_RATE_INTERVAL, burst: int = RUBITIME_RATE_BURST,
+                 timeout: float = RUBITIME_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.limiter = PriorityTokenBucket(interval, burst)
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=10, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def call(self, method: str, payload: dict | None = None, priority: int = PRIORITY_BACKGROUND) -> dict:
+        """Вызывает метод API и возвращает разобранный JSON-ответ."""
+        body = dict(payload or {})
+        body["rk"] = self.api_key
+        start = time.perf_counter()
+        with span("rubitime.wait", priority=priority):
+            await self.limiter.acquire(priority)
+        sent = time.perf_counter()
+        RUBITIME_LIMITER_WAIT.observe(sent - start, str(priority))
+        result = "failed"
+        try:
+            with span("rubitime", method=method):
+                session = self._get_session()
+                async with session.post(self.base_url + method, json=body) as resp:
+                    if resp.status == 429:
+                        result = "rate_limited"
+                        # Превышение лимита — не ответ о записи: иначе сверка приняла бы его за удаление.
+                        resp.raise_for_status()
+                    data = await resp.json(content_type=None)
+                    result = "ok" if isinstance(data, dict) and data.get("status") == "ok" else "error"
+                    return data
+        finally:
+            RUBITIME_LATENCY.observe(time.perf_counter() - sent, method)
+            RUBITIME_REQUESTS.inc(method, result)
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+rubitime_client = RubitimeClient(RUBITIME_API_KEY)
+registry.gauge("rubitime_limiter_queue_depth", "Запросы, ожидающие токен лимитера Rubitime",
+               callback=lambda: rubitime_client.limiter.queue_depth)
@@ -0,0 +1,136 @@
+import asyncio
+import math
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from dotenv import load_dotenv
+
+from services.metrics import registry
+
+load_dotenv()
+
+SCHEDULE_CACHE_TTL = float(os.getenv("SCHEDULE_CACHE_TTL", "30"))
+# Период полураспада счётчика обращений к расписанию, секунд.
+SCHEDULE_DEMAND_HALF_LIFE = float(os.getenv("SCHEDULE_DEMAND_HALF_LIFE", "600"))
+# Сколько устаревшее расписание ещё можно показывать пользователю посреди записи, секунд.
+SCHEDULE_STALE_TTL = float(os.getenv("SCHEDULE_STALE_TTL", "600"))
+
+ScheduleKey = tuple[int, int, int]
+
+
+@dataclass(frozen=True)
+class ScheduleView:
+    """Компактное представление ответа get-schedule: отсортированные даты и свободное время."""
+    dates: tuple[str, ...] = ()
+    times: dict[str, tuple[str, ...]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, data: dict) -> "ScheduleView":
+        # Строки дат и времени одинаковы у всех сотрудников — интернируем, чтобы не дублировать.
+        times = {
+            sys.intern(date): tuple(sys.intern(t) for t, v in (slots or {}).items() if v.get("available"))
+            for date, slots in data.items()
+        }
+        return cls(dates=tuple(sorted(times)), times=times)
+
+
+def _to_int(value: Any) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ScheduleCache:
+    """Общий кэш расписаний get-schedule с TTL и объединением одновременных запросов."""
+
+    def __init__(self, ttl: float = SCHEDULE_CACHE_TTL, half_life: float = SCHEDULE_DEMAND_HALF_LIFE):
+        self.ttl = ttl
+        self.half_life = half_life
+        self._entries: dict[ScheduleKey, tuple[float, ScheduleView]] = {}
+        self._inflight: dict[ScheduleKey, asyncio.Task] = {}
+        self._demand: dict[ScheduleKey, tuple[float, float]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, key: ScheduleKey, max_stale: float = 0.0) -> ScheduleView | None:
+        """Возвращает значение из кэша без запроса к API (допуская устаревание на max_stale секунд)."""
+        entry = self._entries.get(key)
+        if entry and entry[0] + max_stale > time.monotonic():
+            return entry[1]
+        return None
+
+    async def get(self, key: ScheduleKey, loader: Callable[[], Awaitable[ScheduleView | None]],
+                  max_stale: float = 0.0) -> ScheduleView | None:
+        """Возвращает расписание из кэша или ждёт единственный запрос к API."""
+        self._touch(key)
+        value = self.peek(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        # Пользователю посреди записи отдаём недавнее значение сразу, а обновляем в фоне.
+        stale = self.peek(key, max_stale) if max_stale else None
+        if stale is not None:
+            self.hits += 1
+            if key not in self._inflight:
+                self._inflight[key] = asyncio.ensure_future(self._load(key, loader))
+            return stale
+        self.misses += 1
+        return await self.refresh(key, loader)
+
+    async def refresh(self, key: ScheduleKey, loader: Callable[[], Awaitable[ScheduleView | None]],
+                      ttl: float | None = None) -> ScheduleView | None:
+        """Загружает расписание заново, присоединяясь к уже идущему запросу."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def _decayed(self, key: ScheduleKey, now: float) -> float:
+        count, ts = self._demand.get(key, (0.0, now))
+        return count * math.exp(-(now - ts) * math.log(2) / self.half_life)
+
+    def _touch(self, key: ScheduleKey) -> None:
+        now = time.monotonic()
+        self._demand[key] = (self._decayed(key, now) + 1, now)
+
+    def demand(self, key: ScheduleKey) -> float:
+        """Затухающее число недавних обращений пользователей к расписанию."""
+        return self._decayed(key, time.monotonic())
+
+    async def _load(self, key: ScheduleKey, loader: Callable[[], Awaitable[ScheduleView | None]],
+                    ttl: float | None = None) -> ScheduleView | None:
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+            # Если кэш инвалидировали во время запроса, результат отдаём ожидающим, но не сохраняем.
+            if value is not None and self._inflight.get(key) is task:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    def set(self, key: ScheduleKey, value: ScheduleView, ttl: float | None = None) -> None:
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+
+    def invalidate(self, branch_id: Any = None, cooperator_id: Any = None, service_id: Any = None) -> None:
+        """Сбрасывает расписания, совпадающие с переданными идентификаторами."""
+        pattern = (_to_int(branch_id), _to_int(cooperator_id), _to_int(service_id))
+
+        def matches(key: ScheduleKey) -> bool:
+            return all(p is None or p == k for p, k in zip(pattern, key))
+
+        for key in [k for k in self._entries if matches(k)]:
+            del self._entries[key]
+        for key in [k for k in self._inflight if matches(k)]:
+            del self._inflight[key]
+
+
+schedule_cache = ScheduleCache()
+registry.counter("schedule_cache_requests_total", "Обращения к кэшу расписаний", labels=("result",),
+                 callback=lambda: {("hit",): schedule_cache.hits, ("miss",): schedule_cache.misses})
@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+import os
+import time
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+
+from services.catalog import catalog
+from services.logger import get_logger
+from services.rubitime_client import RUBITIME_RATE_INTERVAL
+from services.schedule_cache import ScheduleCache, ScheduleKey, ScheduleView
+
+load_dotenv()
+
+SCHEDULE_PREFETCH_ENABLED = os.getenv("SCHEDULE_PREFETCH_ENABLED", "false").lower() in ('true', '1', 't')
+# Базовый период обновления расписания, которое никто не запрашивал, секунд.
+SCHEDULE_PREFETCH_INTERVAL = float(os.getenv("SCHEDULE_PREFETCH_INTERVAL", "600"))
+# Минимальный период обновления самых востребованных расписаний, секунд.
+SCHEDULE_PREFETCH_MIN_INTERVAL = float(os.getenv("SCHEDULE_PREFETCH_MIN_INTERVAL", "60"))
+# Доля лимита Rubitime API, которую может занимать предзагрузка.
+SCHEDULE_PREFETCH_SHARE = float(os.getenv("SCHEDULE_PREFETCH_SHARE", "0.5"))
+PAIRS_REFRESH_INTERVAL = 300
+
+log = get_logger("prefetch")
+
+
+class SchedulePrefetcher:
+    """Поддерживает расписания всех пар сотрудник/услуга в кэше тёплыми."""
+
+    def __init__(self, cache: ScheduleCache, branch_id: int,
+                 fetch: Callable[[int, int, int], Awaitable[ScheduleView | None]],
+                 interval: float = SCHEDULE_PREFETCH_INTERVAL,
+                 min_interval: float = SCHEDULE_PREFETCH_MIN_INTERVAL,
+                 share: float = SCHEDULE_PREFETCH_SHARE):
+        self.cache = cache
+        self.branch_id = branch_id
+        self.fetch = fetch
+        self.interval = interval
+        self.min_interval = min_interval
+        self.gap = RUBITIME_RATE_INTERVAL / max(share, 0.01)
+        self._queue: list[tuple[float, ScheduleKey]] = []
+        self._pairs_ts = 0.0
+
+    async def load_pairs(self) -> list[ScheduleKey]:
+        """Возвращает все пары (филиал, сотрудник, услуга) из справочника услуг."""
+        snapshot = await catalog.get()
+        return [(self.branch_id, s.cooperator_id, s.id) for s in snapshot.services]
+
+    def refresh_interval(self, key: ScheduleKey) -> float:
+        """Чем чаще расписание запрашивают, тем чаще его обновляем."""
+        return max(self.min_interval, self.interval / (1 + self.cache.demand(key)))
+
+    async def _reload_pairs(self) -> None:
+        pairs = await self.load_pairs()
+        now = time.monotonic()
+        due = {key: ts for ts, key in self._queue}
+        self._queue = [(due.get(key, now), key) for key in pairs]
+        heapq.heapify(self._queue)
+        self._pairs_ts = now
+
+    async def _step(self) -> None:
+        if time.monotonic() - self._pairs_ts > PAIRS_REFRESH_INTERVAL:
+            await self._reload_pairs()
+        if not self._queue:
+            await asyncio.sleep(PAIRS_REFRESH_INTERVAL)
+            return
+        due, key = self._queue[0]
+        now = time.monotonic()
+        if due > now:
+            await asyncio.sleep(min(due - now, PAIRS_REFRESH_INTERVAL))
+            return
+        heapq.heappop(self._queue)
+        interval = self.refresh_interval(key)
+        try:
+            # Держим запись до следующего планового обновления с запасом.
+            await self.cache.refresh(key, lambda: self.fetch(*key), ttl=interval + self.gap * 2)
+        finally:
+            # Пара остаётся в очереди и после ошибки загрузки.
+            heapq.heappush(self._queue, (time.monotonic() + interval, key))
+        await asyncio.sleep(self.gap)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self._step()
+            except Exception:
+                # Ошибка чтения справочника или запроса к API не должна останавливать предзагрузку.
+                log.exception("prefetch error")
+                await asyncio.sleep(self.gap)
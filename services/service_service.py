@@ -1,44 +1,33 @@
-import os
-import time
-
-from dotenv import load_dotenv
-from sqlalchemy import select
-
+from services.catalog import catalog, bump_catalog_version, paginate, ServiceInfo
 from static.models import async_session, Service
 
-load_dotenv()
-
-_services_cache = {}
-CACHE_EXPIRED_TIMEOUT = int(os.getenv("CACHE_EXPIRED_TIMEOUT"))
-
 
-def _cache_expired(ts, timeout=CACHE_EXPIRED_TIMEOUT):
-    return time.time() - ts > timeout
+async def get_services(force_refresh=False) -> tuple[ServiceInfo, ...]:
+    if force_refresh:
+        catalog.invalidate()
+    return (await catalog.get()).services
 
 
-async def get_services(force_refresh=False):
-    async with async_session() as session:
-        result = await session.execute(select(Service))
-        return result.scalars().all()
-
-
-async def get_services_by_cooperator(cooperator_id: int, force_refresh=False):
-    cache = _services_cache.get(cooperator_id)
-    if not force_refresh and cache and not _cache_expired(cache["ts"]):
-        return cache["value"]
-    async with async_session() as session:
-        result = await session.execute(select(Service).where(Service.cooperator_id == cooperator_id))
-        services = result.scalars().all()
-        _services_cache[cooperator_id] = {"value": services, "ts": time.time()}
-        return services
+async def get_services_by_cooperator(cooperator_id: int, force_refresh=False) -> tuple[ServiceInfo, ...]:
+    if force_refresh:
+        catalog.invalidate()
+    return (await catalog.get()).services_by_cooperator.get(cooperator_id, ())
 
 
-def clear_services_cache(cooperator_id=None):
-    global _services_cache
-    if cooperator_id is None:
-        _services_cache = {}
+async def list_services(branch_id: int | None = None, cooperator_id: int | None = None, search: str | None = None,
+                        field: str = "name", after_id: int | None = None,
+                        limit: int = 100) -> tuple[tuple[ServiceInfo, ...], int | None]:
+    """Страница услуг из кэша справочника и id для запроса следующей."""
+    snapshot = await catalog.get()
+    if cooperator_id is not None:
+        items = snapshot.services_by_cooperator.get(cooperator_id, ())
+        if branch_id is not None:
+            items = tuple(s for s in items if s.branch_id == branch_id)
+    elif branch_id is not None:
+        items = snapshot.services_by_branch.get(branch_id, ())
     else:
-        _services_cache.pop(cooperator_id, None)
+        items = snapshot.services
+    return paginate(items, search, field, after_id, limit)
 
 
 async def add_service(id: int, branch_id: int, cooperator_id: int, name: str, price: float, duration: int):
@@ -52,5 +41,6 @@ async def add_service(id: int, branch_id: int, cooperator_id: int, name: str, pr
                 name=name, price=price, duration=duration
             )
             session.add(service)
-    clear_services_cache(cooperator_id)
+            await bump_catalog_version(session)
+    catalog.invalidate()
     return True
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+
+from services.logger import get_logger
+from services.metrics import registry
+from services.tracing import span
+
+load_dotenv()
+
+log = get_logger("sms")
+
+SMSRU_LATENCY = registry.histogram("smsru_request_seconds", "Время ответа SMS.ru")
+SMSRU_REQUESTS = registry.counter("smsru_requests_total", "Запросы к SMS.ru по результату", labels=("result",))
+SMSRU_MESSAGES = registry.counter("smsru_messages_total", "Сообщения в запросах к SMS.ru")
+
+SMSRU_API_ID = os.getenv("SMSRU_API_ID")
+SMSRU_API_URL = os.getenv("SMSRU_API_URL", "https://sms.ru/sms/send")
+# Сколько ждать попутные сообщения перед отправкой пачки, секунд.
+SMS_BATCH_WINDOW = float(os.getenv("SMS_BATCH_WINDOW", "0.2"))
+# Сколько обработчик ждёт ответа по своему SMS (пачка, запрос и запас), секунд.
+SMS_SEND_TIMEOUT = float(os.getenv("SMS_SEND_TIMEOUT", "45"))
+# SMS.ru принимает до 100 получателей в одном запросе.
+SMS_BATCH_SIZE = 100
+
+
+def _error(text: str, code: int | None = None) -> dict:
+    return {"status": "ERROR", "status_code": code, "status_text": text}
+
+
+class SmsDispatcher:
+    """Очередь SMS: объединяет сообщения в multi-запросы SMS.ru через общий пул соединений."""
+
+    def __init__(self, api_id: str | None, url: str = SMSRU_API_URL, window: float = SMS_BATCH_WINDOW,
+                 batch_size: int = SMS_BATCH_SIZE, send_timeout: float = SMS_SEND_TIMEOUT):
+        self.api_id = api_id
+        self.url = url
+        self.window = window
+        self.batch_size = batch_size
+        self.send_timeout = send_timeout
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._timer = None
+        self._tasks: set[asyncio.Task] = set()
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+
+    async def send(self, phone: str, text: str) -> dict:
+        """Ставит SMS в очередь и возвращает статус SMS.ru для этого получателя."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((phone.lstrip("+"), text, fut))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        # Время ожидания пачки и ответа SMS.ru, как его видит обработчик.
+        with span("smsru.send"):
+            try:
+                return await asyncio.wait_for(fut, self.send_timeout)
+            except asyncio.TimeoutError:
+                log.error("SMS.ru response timed out")
+                return _error("Нет ответа от SMS.ru")
+
+    async def send_many(self, messages: list[tuple[str, str]]) -> list[dict]:
+        """Отправляет несколько SMS; результат в том же порядке, что и messages."""
+        return list(await asyncio.gather(*(self.send(phone, text) for phone, text in messages)))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            # Получатель — ключ в multi[...], поэтому в одной пачке номера не повторяются.
+            batch, rest, phones = [], [], set()
+            for item in self._pending:
+                if len(batch) < self.batch_size and item[0] not in phones:
+                    batch.append(item)
+                    phones.add(item[0])
+                else:
+                    rest.append(item)
+            self._pending = rest
+            task = asyncio.ensure_future(self._post(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _post(self, batch: list[tuple[str, str, asyncio.Future]]) -> None:
+        data = {"api_id": self.api_id, "json": 1}
+        for phone, text, _ in batch:
+            data[f"multi[{phone}]"] = text
+        start = time.perf_counter()
+        results, default, result = {}, _error("Нет ответа от SMS.ru"), "failed"
+        try:
+            async with self._get_session().post(self.url, data=data) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    log.error("SMS.ru error: %s, %s", resp.status, text)
+                    default = _error(text)
+                    result = "error"
+                else:
+                    res = await resp.json(content_type=None)
+                    if not isinstance(res, dict):
+                        raise ValueError(f"unexpected response: {res!r}")
+                    results = res.get("sms", {}) if res.get("status") == "OK" else {}
+                    default = _error(res.get("status_text", "Нет ответа для номера"), res.get("status_code"))
+                    result = "ok" if res.get("status") == "OK" else "error"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            default = _error(str(e))
+        except Exception as e:
+            # Неожиданный ответ (не JSON и т. п.) не должен оставлять обработчики ждать вечно.
+            log.exception("SMS.ru response could not be handled")
+            results, default, result = {}, _error(str(e)), "failed"
+        finally:
+            SMSRU_LATENCY.observe(time.perf_counter() - start)
+            SMSRU_REQUESTS.inc(result)
+            SMSRU_MESSAGES.inc(value=len(batch))
+            if not isinstance(results, dict):
+                results = {}
+            for phone, _, fut in batch:
+                if not fut.done():
+                    fut.set_result(results.get(phone, default))
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+sms_dispatcher = SmsDispatcher(SMSRU_API_ID)
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest, TelegramNotFound, TelegramNetworkError,
+    TelegramServerError
+)
+from dotenv import load_dotenv
+
+from services.rubitime_client import PriorityTokenBucket
+
+load_dotenv()
+
+# Telegram допускает около 30 сообщений в секунду на бота и 1 сообщение в секунду в один чат.
+TELEGRAM_GLOBAL_RATE = int(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1"))
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "10"))
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", "3"))
+
+SENT = "sent"
+# Чат недоступен (бот заблокирован, чат не найден) — повторять бессмысленно.
+REJECTED = "rejected"
+# Временная ошибка, попытки исчерпаны — можно повторить позже.
+FAILED = "failed"
+
+
+class TelegramSender:
+    """Параллельная рассылка сообщений с учётом лимитов Telegram и повторами."""
+
+    def __init__(self, bot: Bot, rate: int = TELEGRAM_GLOBAL_RATE,
+                 chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+                 concurrency: int = TELEGRAM_SEND_CONCURRENCY, retries: int = TELEGRAM_SEND_RETRIES):
+        self.bot = bot
+        self.limiter = PriorityTokenBucket(1 / rate, burst=rate)
+        self.chat_interval = chat_interval
+        self.retries = retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chat_locks: dict[int, tuple[asyncio.Lock, int]] = {}
+        self._chat_last: dict[int, float] = {}
+
+    async def _wait_chat(self, chat_id: int) -> None:
+        delay = self._chat_last.get(chat_id, 0) + self.chat_interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send(self, chat_id: int, text: str) -> str:
+        """Отправляет одно сообщение и возвращает SENT, REJECTED или FAILED."""
+        lock, users = self._chat_locks.get(chat_id, (asyncio.Lock(), 0))
+        self._chat_locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock:
+                attempt = 0
+                while True:
+                    await self._wait_chat(chat_id)
+                    await self.limiter.acquire()
+                    try:
+                        await self.bot.send_message(chat_id, text)
+                        return SENT
+                    except TelegramRetryAfter as e:
+                        await asyncio.sleep(e.retry_after)
+                    except (TelegramForbiddenError, TelegramNotFound, TelegramBadRequest):
+                        return REJECTED
+                    except (TelegramNetworkError, TelegramServerError):
+                        await asyncio.sleep(2 ** attempt)
+                    finally:
+                        self._chat_last[chat_id] = time.monotonic()
+                    attempt += 1
+                    if attempt > self.retries:
+                        return FAILED
+        finally:
+            lock, users = self._chat_locks[chat_id]
+            if users > 1:
+                self._chat_locks[chat_id] = (lock, users - 1)
+            else:
+                del self._chat_locks[chat_id]
+
+    async def _send_bounded(self, chat_id: int, text: str) -> str:
+        async with self._semaphore:
+            try:
+                return await self.send(chat_id, text)
+            except Exception:
+                return FAILED
+
+    async def send_many(self, messages: list[tuple[int, str]]) -> list[str]:
+        """Рассылает сообщения параллельно; результат в том же порядке, что и messages."""
+        results = await asyncio.gather(*(self._send_bounded(chat_id, text) for chat_id, text in messages))
+        threshold = time.monotonic() - self.chat_interval
+        self._chat_last = {chat_id: ts for chat_id, ts in self._chat_last.items() if ts > threshold}
+        return list(results)
@@ -0,0 +1,97 @@
+"""Отчёт по трассам бота: задержки шагов записи и воронка.
+
+Запуск: python -m services.trace_report [traces.jsonl]
+
+Для каждого обработчика (и шага FSM, в котором он вызван) печатает число
+вызовов, медиану и 95-й перцентиль времени и из чего это время сложилось
+(БД, Rubitime, Telegram, SMS.ru). Воронка показывает, сколько
+пользователей дошло до каждого шага записи, сколько на нём остановилось
+и медианное время до следующего шага (ответ пользователя плюс обработка).
+"""
+import json
+import statistics
+import sys
+from collections import defaultdict
+
+from services.tracing import TRACE_FILE
+
+BOOKING_STEPS = (
+    "BookingStates:selecting_cooperator",
+    "BookingStates:selecting_service",
+    "BookingStates:selecting_date",
+    "BookingStates:selecting_time",
+    "BookingStates:entering_name",
+    "BookingStates:entering_phone",
+    "BookingStates:confirming_sms",
+    "BookingStates:confirming_create",
+)
+
+
+def load(path: str) -> tuple[list[dict], dict[str, list[dict]]]:
+    """Корневые span'ы обработчиков и дочерние span'ы по trace_id."""
+    roots, children = [], defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["parent_id"] is None:
+                roots.append(entry)
+            else:
+                children[entry["trace_id"]].append(entry)
+    return roots, children
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def step_latency(roots: list[dict], children: dict[str, list[dict]]) -> None:
+    groups = defaultdict(list)
+    for root in roots:
+        groups[(root["attrs"].get("state") or "-", root["attrs"].get("handler"))].append(root)
+    print(f"{'state':<38} {'handler':<22} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8}  breakdown (avg ms)")
+    for (state, handler), items in sorted(groups.items()):
+        durations = [r["duration_ms"] for r in items]
+        parts = defaultdict(float)
+        for root in items:
+            # Только непосредственные дети: вложенные span'ы уже входят в их время.
+            for child in children.get(root["trace_id"], ()):
+                if child["parent_id"] == root["span_id"]:
+                    parts[child["name"].split(".")[0]] += child["duration_ms"]
+        breakdown = ", ".join(f"{name} {total / len(items):.1f}" for name, total in sorted(parts.items()))
+        print(f"{state:<38} {handler or '-':<22} {len(items):>6} {statistics.median(durations):>8.1f} "
+              f"{_percentile(durations, 0.95):>8.1f}  {breakdown}")
+
+
+def funnel(roots: list[dict]) -> None:
+    by_user = defaultdict(list)
+    for root in roots:
+        if root["user_id"] is not None:
+            by_user[root["user_id"]].append(root)
+    reached, dropped, waits = defaultdict(int), defaultdict(int), defaultdict(list)
+    for spans in by_user.values():
+        spans.sort(key=lambda r: r["start"])
+        # Первый вход пользователя в каждый шаг; последний шаг без продолжения — точка ухода.
+        first_seen = {}
+        for root in spans:
+            first_seen.setdefault(root["attrs"].get("state"), root["start"])
+            # В шаг, куда перевёл обработчик, пользователь попал в конце этого обновления.
+            first_seen.setdefault(root["attrs"].get("next_state"), root["start"] + root["duration_ms"] / 1000)
+        steps = [step for step in BOOKING_STEPS if step in first_seen]
+        for step in steps:
+            reached[step] += 1
+        for current, following in zip(steps, steps[1:]):
+            waits[current].append(first_seen[following] - first_seen[current])
+        last_state = spans[-1]["attrs"].get("next_state", spans[-1]["attrs"].get("state"))
+        if last_state in BOOKING_STEPS and last_state != BOOKING_STEPS[-1]:
+            dropped[last_state] += 1
+    print(f"\n{'step':<38} {'reached':>8} {'dropped':>8} {'median s to next':>17}")
+    for step in BOOKING_STEPS:
+        wait = f"{statistics.median(waits[step]):.1f}" if waits[step] else "-"
+        print(f"{step:<38} {reached[step]:>8} {dropped[step]:>8} {wait:>17}")
+
+
+if __name__ == "__main__":
+    roots, children = load(sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE)
+    step_latency(roots, children)
+    funnel(roots)
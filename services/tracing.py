@@ -0,0 +1,156 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import time
+from contextlib import contextmanager, nullcontext
+from logging.handlers import QueueListener
+from typing import Any, ContextManager
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.logger import DroppingQueueHandler, LOG_QUEUE_SIZE, ROOT_LOGGER
+
+load_dotenv()
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() in ("true", "1", "t")
+# Файл, куда span'ы пишутся по одному JSON-объекту в строке.
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# Доля трасс (обновлений пользователей), которые записываются, 0..1.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+_exporter: logging.Logger | None = None
+_listener: QueueListener | None = None
+
+
+class Span:
+    """Интервал работы внутри трассы; у дочерних span'ов те же trace_id и user_id."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "user_id", "attrs", "start", "_t0", "error")
+
+    def __init__(self, name: str, parent: "Span | None", user_id: int | None, attrs: dict):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(8)
+        self.span_id = secrets.token_hex(4)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.user_id = parent.user_id if parent else user_id
+        self.attrs = attrs
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.error = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+def _describe(value: Any) -> str:
+    """Значения атрибутов, не сериализуемые в JSON: для SQL-выражений — вид запроса и таблица."""
+    kind = getattr(value, "__visit_name__", None)
+    if kind is None:
+        return str(value)
+    table = getattr(value, "table", None)
+    if table is None and hasattr(value, "get_final_froms"):
+        froms = value.get_final_froms()
+        table = froms[0] if froms else None
+    return f"{kind} {getattr(table, 'name', '')}".strip()
+
+
+def _get_exporter() -> logging.Logger:
+    # Запись в файл — в отдельном потоке через ту же ограниченную очередь, что и у логов.
+    global _exporter, _listener
+    if _exporter is None:
+        handler = logging.FileHandler(TRACE_FILE, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _listener = QueueListener(log_queue, handler)
+        _listener.start()
+        exporter = logging.getLogger(f"{ROOT_LOGGER}.traces")
+        exporter.addHandler(DroppingQueueHandler(log_queue))
+        exporter.setLevel(logging.INFO)
+        exporter.propagate = False
+        _exporter = exporter
+        atexit.register(shutdown_tracing)
+    return _exporter
+
+
+def _export(current: Span) -> None:
+    entry = {
+        "trace_id": current.trace_id,
+        "span_id": current.span_id,
+        "parent_id": current.parent_id,
+        "name": current.name,
+        "user_id": current.user_id,
+        "start": round(current.start, 6),
+        "duration_ms": round((time.perf_counter() - current._t0) * 1000, 3),
+        "attrs": current.attrs,
+    }
+    if current.error:
+        entry["error"] = current.error
+    _get_exporter().info(json.dumps(entry, ensure_ascii=False, default=_describe))
+
+
+@contextmanager
+def _run(name: str, parent: Span | None, user_id: int | None, attrs: dict):
+    current = Span(name, parent, user_id, attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        _export(current)
+
+
+def trace(name: str, user_id: int | None, **attrs: Any) -> ContextManager[Span | None]:
+    """Начинает трассу (обработка одного обновления пользователя) с учётом выборки."""
+    if not TRACE_ENABLED or random.random() >= TRACE_SAMPLE_RATE:
+        return nullcontext()
+    return _run(name, None, user_id, attrs)
+
+
+def span(name: str, **attrs: Any) -> ContextManager[Span | None]:
+    """Дочерний span; вне начатой трассы ничего не делает."""
+    parent = _current.get()
+    if parent is None:
+        return nullcontext()
+    return _run(name, parent, None, attrs)
+
+
+def shutdown_tracing() -> None:
+    """Дописывает накопленные span'ы в файл."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class TracedAsyncSession(AsyncSession):
+    """AsyncSession, отмечающая запросы и коммиты span'ами текущей трассы."""
+
+    async def execute(self, statement, *args, **kwargs):
+        with span("db.execute", statement=statement):
+            return await super().execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        with span("db.execute", statement=statement):
+            return await super().scalar(statement, *args, **kwargs)
+
+    async def get(self, entity, *args, **kwargs):
+        with span("db.get", entity=getattr(entity, "__tablename__", str(entity))):
+            return await super().get(entity, *args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        with span("db.flush"):
+            return await super().flush(*args, **kwargs)
+
+    async def commit(self):
+        with span("db.commit"):
+            return await super().commit()
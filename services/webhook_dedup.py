@@ -0,0 +1,74 @@
+import datetime
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# О скольких записях помнить последний отпечаток и версию.
+WEBHOOK_DEDUP_SIZE = int(os.getenv("WEBHOOK_DEDUP_SIZE", "10000"))
+# Поле данных вебхука с временем изменения записи. В контракте вебхуков Rubitime (api.txt) такого
+# поля нет: без него версия — время получения, и события, доставленные не по порядку, не распознаются.
+WEBHOOK_VERSION_FIELD = os.getenv("WEBHOOK_VERSION_FIELD", "updated_at")
+
+
+def fingerprint(event: str, data: dict) -> str:
+    """Отпечаток события: одинаков у повторной доставки того же вебхука."""
+    raw = json.dumps([event, data], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def event_version(data: dict, received_at: datetime.datetime) -> float:
+    """Версия события: время изменения из WEBHOOK_VERSION_FIELD, иначе время получения (только порядок приёма)."""
+    value = data.get(WEBHOOK_VERSION_FIELD)
+    if value:
+        try:
+            return datetime.datetime.fromisoformat(str(value)).timestamp()
+        except ValueError:
+            pass
+    return received_at.timestamp()
+
+
+class WebhookDeduplicator:
+    """Ограниченный LRU последних отпечатков и применённых версий записей."""
+
+    def __init__(self, size: int = WEBHOOK_DEDUP_SIZE):
+        self.size = size
+        # rubitime_id -> отпечаток последнего принятого состояния
+        self._last: OrderedDict[int, str] = OrderedDict()
+        # rubitime_id -> (версия, запись удалена)
+        self._versions: OrderedDict[int, tuple[float, bool]] = OrderedDict()
+
+    def last(self, rubitime_id: int) -> str | None:
+        return self._last.get(rubitime_id)
+
+    def is_duplicate(self, rubitime_id: int, fp: str) -> bool:
+        """Повтор — только совпадение с последним состоянием записи: возврат к прежнему состоянию не повтор."""
+        return self._last.get(rubitime_id) == fp
+
+    def remember(self, rubitime_id: int, fp: str) -> None:
+        self._last[rubitime_id] = fp
+        self._last.move_to_end(rubitime_id)
+        if len(self._last) > self.size:
+            self._last.popitem(last=False)
+
+    def is_stale(self, rubitime_id: int, version: float) -> bool:
+        """Событие старше уже применённого или относится к удалённой записи."""
+        last = self._versions.get(rubitime_id)
+        if last is None:
+            return False
+        last_version, removed = last
+        return removed or version < last_version
+
+    def applied(self, rubitime_id: int, version: float, removed: bool = False) -> None:
+        last = self._versions.get(rubitime_id)
+        if last is not None:
+            version = max(version, last[0])
+            removed = removed or last[1]
+        self._versions[rubitime_id] = (version, removed)
+        self._versions.move_to_end(rubitime_id)
+        if len(self._versions) > self.size:
+            self._versions.popitem(last=False)
@@ -0,0 +1,319 @@
+import asyncio
+import datetime
+import json
+import os
+import time
+from typing import Any
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, func
+
+from services.logger import get_logger
+from services.metrics import registry, LAG_BUCKETS
+from services.record_mirror import upsert_mirror
+from services.record_service import records_by_rubitime_id_query
+from services.reminder_scheduler import reminder_scheduler
+from services.webhook_dedup import WebhookDeduplicator, fingerprint, event_version
+from services.schedule_cache import schedule_cache
+from static.models import ReminderRecord, WebhookEvent, async_session, async_read_session
+
+load_dotenv()
+
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "200"))
+# Как часто проверять очередь, если событие положил другой процесс, секунд.
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "1"))
+# Сколько хранить обработанные события (для статистики и разбора ошибок), секунд.
+WEBHOOK_EVENTS_RETENTION = int(os.getenv("WEBHOOK_EVENTS_RETENTION", "86400"))
+PRUNE_INTERVAL = 3600
+
+CREATE = "event-create-record"
+UPDATE = "event-update-record"
+REMOVE = "event-remove-record"
+WEBHOOK_EVENTS = (CREATE, UPDATE, REMOVE)
+
+
+log = get_logger("webhook_queue")
+
+WEBHOOK_LAG = registry.histogram(
+    "webhook_lag_seconds", "Время от приёма вебхука до его обработки", buckets=LAG_BUCKETS)
+
+
+def parse_event(payload: Any) -> tuple[str, int, dict]:
+    """Проверяет тело вебхука Rubitime, возвращает (событие, rubitime_id, данные)."""
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be a JSON object")
+    event = payload.get("event")
+    if event not in WEBHOOK_EVENTS:
+        raise ValueError(f"unknown event: {event}")
+    data = payload.get("data")
+    if not isinstance(data, dict):
+        raise ValueError("data must be a JSON object")
+    try:
+        rubitime_id = int(data.get("id"))
+    except (TypeError, ValueError):
+        raise ValueError("data.id must be an integer")
+    return event, rubitime_id, data
+
+
+# Повторные доставки, уже принятые этим процессом, отбрасываются без обращения к базе.
+ingest_dedup = WebhookDeduplicator()
+
+
+async def enqueue_event(payload: Any) -> int | None:
+    """Кладёт событие вебхука в очередь и возвращает его номер (None — повтор уже принятого)."""
+    event, rubitime_id, data = parse_event(payload)
+    fp = fingerprint(event, data)
+    if ingest_dedup.is_duplicate(rubitime_id, fp):
+        return None
+    async with async_session() as session:
+        row = WebhookEvent(
+            event=event,
+            rubitime_id=rubitime_id,
+            payload=json.dumps(data, ensure_ascii=False),
+            fingerprint=fp,
+            received_at=datetime.datetime.now()
+        )
+        session.add(row)
+        await session.commit()
+    ingest_dedup.remember(rubitime_id, fp)
+    webhook_consumer.notify()
+    return row.id
+
+
+def coalesce(events: list[tuple[WebhookEvent, dict]]) -> dict[int, tuple[str, dict, list[int]]]:
+    """Сворачивает упорядоченные события пачки в одно действие на rubitime_id: (событие, данные, номера событий)."""
+    ops: dict[int, tuple[str, dict, list[int]]] = {}
+    for e, data in events:
+        prev = ops.get(e.rubitime_id)
+        if prev is None:
+            ops[e.rubitime_id] = (e.event, data, [e.id])
+            continue
+        prev_event, prev_data, ids = prev
+        ids.append(e.id)
+        if prev_event == REMOVE:
+            # Удалённую запись последующие события не возвращают.
+            continue
+        if e.event == REMOVE:
+            ops[e.rubitime_id] = (REMOVE, data, ids)
+        elif e.event == CREATE and prev_event == UPDATE:
+            # Создание пришло позже правки: данные правки новее, создание лишь дополняет поля.
+            ops[e.rubitime_id] = (UPDATE, {**data, **prev_data}, ids)
+        else:
+            # Создание с последующими правками — это одно создание с итоговыми данными.
+            ops[e.rubitime_id] = (prev_event, {**prev_data, **data}, ids)
+    return ops
+
+
+def _parse_datetime(value: Any) -> datetime.datetime | None:
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+class WebhookConsumer:
+    """Фоновый обработчик очереди вебхуков: применяет события пачками в одной транзакции."""
+
+    def __init__(self, batch_size: int = WEBHOOK_BATCH_SIZE, poll_interval: float = WEBHOOK_POLL_INTERVAL,
+                 retention: int = WEBHOOK_EVENTS_RETENTION):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._wakeup = asyncio.Event()
+        self._pruned_at = 0.0
+        self.dedup = WebhookDeduplicator()
+        self.stats = {
+            "batches": 0, "events": 0, "applied": 0, "coalesced": 0,
+            "duplicates": 0, "stale": 0, "failed": 0, "last_lag": 0.0,
+        }
+
+    def notify(self) -> None:
+        """Будит обработчик, если событие пришло в этом же процессе."""
+        self._wakeup.set()
+
+    async def _pending(self) -> list[WebhookEvent]:
+        async with async_read_session() as session:
+            result = await session.execute(
+                select(WebhookEvent)
+                .where(WebhookEvent.processed_at == None)
+                .order_by(WebhookEvent.id)
+                .limit(self.batch_size)
+            )
+            return result.scalars().all()
+
+    async def _apply(self, ops: dict[int, tuple[str, dict, list[int]]], versions: dict[int, float],
+                     skipped: list[int] = ()) -> list[tuple[int, datetime.datetime, bool, bool]]:
+        """Применяет действия в одной транзакции и отмечает события (и отброшенные) обработанными."""
+        to_schedule = []
+        now = datetime.datetime.now()
+        async with async_session() as session:
+            async with session.begin():
+                result = await session.execute(records_by_rubitime_id_query(list(ops)))
+                records = {r.rubitime_id: r for r in result.scalars()}
+                for rubitime_id, (event, data, _) in ops.items():
+                    # Зеркало получает каждое событие, даже если записи бота оно не касается.
+                    await upsert_mirror(session, rubitime_id, data, versions[rubitime_id], removed=event == REMOVE)
+                    rec = records.get(rubitime_id)
+                    dt = _parse_datetime(data.get("record"))
+                    user_id = data.get("user_id")
+                    # Правка без известной записи — тоже создание: создание могло прийти позже или потеряться.
+                    if event in (CREATE, UPDATE) and not rec and dt and user_id:
+                        rec = ReminderRecord(
+                            rubitime_id=rubitime_id,
+                            user_id=user_id,
+                            datetime=dt,
+                            name=data.get("name", ""),
+                            phone=data.get("phone", ""),
+                            synced_at=now
+                        )
+                        session.add(rec)
+                        to_schedule.append(rec)
+                    elif event == UPDATE and rec and dt:
+                        rec.datetime = dt
+                        rec.name = data.get("name", "")
+                        rec.phone = data.get("phone", "")
+                        rec.synced_at = now
+                        to_schedule.append(rec)
+                    elif event == REMOVE and rec:
+                        await session.delete(rec)
+                await session.flush()
+                to_schedule = [(r.id, r.datetime, r.reminded_24h, r.reminded_12h) for r in to_schedule]
+                ids = [event_id for _, _, event_ids in ops.values() for event_id in event_ids] + list(skipped)
+                await session.execute(
+                    update(WebhookEvent).where(WebhookEvent.id.in_(ids)).values(processed_at=now)
+                )
+        return to_schedule
+
+    async def _mark_failed(self, ids: list[int], error: str) -> None:
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    update(WebhookEvent).where(WebhookEvent.id.in_(ids))
+                    .values(processed_at=datetime.datetime.now(), error=error[:500])
+                )
+
+    async def process_batch(self) -> int:
+        """Обрабатывает одну пачку событий, возвращает число прочитанных из очереди."""
+        events = await self._pending()
+        if not events:
+            return 0
+        # Повторы и устаревшие события отбрасываем по памяти, не трогая reminder_records.
+        fresh, skipped = [], []
+        # Последнее состояние каждой записи: применённое раньше или уже принятое в этой пачке.
+        last_fps: dict[int, str | None] = {}
+        versions: dict[int, float] = {}
+        for e in events:
+            data = json.loads(e.payload)
+            fp = e.fingerprint or fingerprint(e.event, data)
+            version = event_version(data, e.received_at)
+            if e.rubitime_id not in last_fps:
+                last_fps[e.rubitime_id] = self.dedup.last(e.rubitime_id)
+            if fp == last_fps[e.rubitime_id]:
+                self.stats["duplicates"] += 1
+                skipped.append(e.id)
+            elif self.dedup.is_stale(e.rubitime_id, version):
+                self.stats["stale"] += 1
+                skipped.append(e.id)
+            else:
+                last_fps[e.rubitime_id] = fp
+                fresh.append((version, e, data, fp))
+                versions[e.rubitime_id] = max(version, versions.get(e.rubitime_id, version))
+        fresh.sort(key=lambda item: (item[0], item[1].id))
+        ops = coalesce([(e, data) for _, e, data, _ in fresh])
+        applied = set(ops)
+        try:
+            to_schedule = await self._apply(ops, versions, skipped)
+        except Exception as e:
+            # Пачка не применилась целиком — применяем по одной записи, виновника откладываем с ошибкой.
+            log.warning("batch failed, retrying one by one: %s", e)
+            to_schedule = await self._apply({}, versions, skipped)
+            for rubitime_id, op in ops.items():
+                try:
+                    to_schedule += await self._apply({rubitime_id: op}, versions)
+                except Exception as e:
+                    applied.discard(rubitime_id)
+                    self.stats["failed"] += len(op[2])
+                    await self._mark_failed(op[2], str(e))
+                    log.error("event failed: %s", e, extra={"rubitime_id": rubitime_id})
+        # Итоговое состояние записи — последнее событие после упорядочивания по версии.
+        for _, e, _, fp in fresh:
+            if e.rubitime_id in applied:
+                self.dedup.remember(e.rubitime_id, fp)
+        for rubitime_id in applied:
+            self.dedup.applied(rubitime_id, versions[rubitime_id], removed=ops[rubitime_id][0] == REMOVE)
+        for record_id, dt, reminded_24h, reminded_12h in to_schedule:
+            reminder_scheduler.schedule(record_id, dt, reminded_24h, reminded_12h)
+        for _, data, _ in ops.values():
+            # Занятость слотов изменилась — сбрасываем расписания сотрудника.
+            schedule_cache.invalidate(data.get("branch_id"), data.get("cooperator_id"))
+        self.stats["batches"] += 1
+        self.stats["events"] += len(events)
+        self.stats["applied"] += len(ops)
+        self.stats["coalesced"] += len(fresh) - len(ops)
+        now = datetime.datetime.now()
+        self.stats["last_lag"] = (now - events[0].received_at).total_seconds()
+        for e in events:
+            WEBHOOK_LAG.observe((now - e.received_at).total_seconds())
+        return len(events)
+
+    async def prune(self) -> int:
+        """Удаляет обработанные события старше срока хранения."""
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=self.retention)
+        async with async_session() as session:
+            async with session.begin():
+                result = await session.execute(
+                    delete(WebhookEvent).where(WebhookEvent.processed_at < cutoff)
+                )
+        return result.rowcount
+
+    async def run(self) -> None:
+        """Бесконечный цикл обработки очереди."""
+        while True:
+            read = 0
+            try:
+                read = await self.process_batch()
+                if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+                    self._pruned_at = time.monotonic()
+                    await self.prune()
+            except Exception:
+                log.exception("consumer error")
+            if read < self.batch_size:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def queue_stats(window: int = 60) -> dict:
+    """Глубина очереди, задержка и пропускная способность по данным таблицы (для всех процессов)."""
+    now = datetime.datetime.now()
+    since = now - datetime.timedelta(seconds=window)
+    async with async_read_session() as session:
+        pending, oldest = (await session.execute(
+            select(func.count(), func.min(WebhookEvent.received_at)).where(WebhookEvent.processed_at == None)
+        )).one()
+        recent = (await session.execute(
+            select(WebhookEvent.received_at, WebhookEvent.processed_at, WebhookEvent.error)
+            .where(WebhookEvent.processed_at >= since)
+        )).all()
+    lags = [(processed - received).total_seconds() for received, processed, _ in recent]
+    return {
+        "pending": pending,
+        "oldest_pending_age": (now - oldest).total_seconds() if oldest else 0.0,
+        "processed_last_window": len(recent),
+        "failed_last_window": sum(1 for *_, error in recent if error),
+        "throughput_per_sec": len(recent) / window,
+        "avg_lag": sum(lags) / len(lags) if lags else 0.0,
+        "max_lag": max(lags, default=0.0),
+        "window": window,
+    }
+
+
+webhook_consumer = WebhookConsumer()
+registry.counter(
+    "webhook_events_total", "События вебхуков, обработанные очередью, по результату", labels=("result",),
+    callback=lambda: {
+        (name,): webhook_consumer.stats[name]
+        for name in ("events", "applied", "coalesced", "duplicates", "stale", "failed")
+    })
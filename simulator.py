@@ -0,0 +1,253 @@
+"""Локальный симулятор Rubitime API и SMS.ru: uvicorn simulator:app --port 8001"""
+import asyncio
+import datetime
+import itertools
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+load_dotenv()
+
+SIMULATOR_RATE_INTERVAL = float(os.getenv("SIMULATOR_RATE_INTERVAL", "5"))
+# Пусто — вебхуки не отправляются.
+SIMULATOR_WEBHOOK_URL = os.getenv("SIMULATOR_WEBHOOK_URL", "http://127.0.0.1:8000/webhook")
+SIMULATOR_WEBHOOK_RETRIES = int(os.getenv("SIMULATOR_WEBHOOK_RETRIES", "3"))
+# Если задан, запросы с другим rk отклоняются.
+SIMULATOR_API_KEY = os.getenv("SIMULATOR_API_KEY")
+# Искусственная задержка ответа API, секунд.
+SIMULATOR_LATENCY = float(os.getenv("SIMULATOR_LATENCY", "0"))
+SIMULATOR_DAYS = int(os.getenv("SIMULATOR_DAYS", "14"))
+SIMULATOR_SLOT_MINUTES = int(os.getenv("SIMULATOR_SLOT_MINUTES", "60"))
+WORK_HOURS = (9, 21)
+
+records: dict[int, dict] = {}
+record_ids = itertools.count(100000)
+sms_ids = itertools.count(1)
+last_request: dict[str | None, float] = {}
+balance = 1000.0
+webhook_tasks: set[asyncio.Task] = set()
+http: aiohttp.ClientSession | None = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global http
+    http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    try:
+        yield
+    finally:
+        await asyncio.gather(*webhook_tasks, return_exceptions=True)
+        await http.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def ok(data) -> JSONResponse:
+    return JSONResponse({"status": "ok", "message": "Success", "data": data})
+
+
+def error(message: str, status_code: int = 200) -> JSONResponse:
+    return JSONResponse({"status": "error", "message": message, "data": None}, status_code=status_code)
+
+
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _parse_record_time(value) -> datetime.datetime | None:
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _slots(day: datetime.date) -> list[str]:
+    start, end = WORK_HOURS
+    minutes = range(start * 60, end * 60, SIMULATOR_SLOT_MINUTES)
+    return [f"{m // 60:02d}:{m % 60:02d}" for m in minutes]
+
+
+def _busy(cooperator_id: int) -> set[str]:
+    return {
+        r["record"][:16] for r in records.values()
+        if int(r["cooperator_id"]) == cooperator_id
+    }
+
+
+async def _send_webhook(event: str, record: dict) -> None:
+    payload = {"from": "user", "event": event, "data": record}
+    for attempt in range(SIMULATOR_WEBHOOK_RETRIES):
+        try:
+            async with http.post(SIMULATOR_WEBHOOK_URL, json=payload) as resp:
+                if resp.status == 200:
+                    return
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        # Как и Rubitime, повторяем доставку, пока не получим 200.
+        await asyncio.sleep(2 ** attempt)
+
+
+def webhook(event: str, record: dict) -> None:
+    if not SIMULATOR_WEBHOOK_URL:
+        return
+    # Снимок записи: к моменту отправки она может измениться следующим запросом.
+    task = asyncio.create_task(_send_webhook(event, dict(record)))
+    webhook_tasks.add(task)
+    task.add_done_callback(webhook_tasks.discard)
+
+
+def get_schedule(body: dict) -> JSONResponse:
+    try:
+        cooperator_id = int(body["cooperator_id"])
+        int(body["branch_id"]), int(body["service_id"])
+    except (KeyError, TypeError, ValueError):
+        return error("Не указаны branch_id, cooperator_id или service_id")
+    only_available = body.get("only_available")
+    busy = _busy(cooperator_id)
+    now = datetime.datetime.now()
+    data = {}
+    for offset in range(SIMULATOR_DAYS):
+        day = now.date() + datetime.timedelta(days=offset)
+        slots = {}
+        for slot in _slots(day):
+            key = f"{day} {slot}"
+            if datetime.datetime.strptime(key, "%Y-%m-%d %H:%M") <= now:
+                continue
+            available = key not in busy
+            if only_available is not None and bool(int(only_available)) != available:
+                continue
+            slots[slot] = {"available": available}
+        if slots:
+            data[str(day)] = slots
+    return ok(data)
+
+
+def create_record(body: dict) -> JSONResponse:
+    missing = [k for k in ("branch_id", "cooperator_id", "service_id", "status", "record") if body.get(k) in (None, "")]
+    if missing:
+        return error(f"Не указаны обязательные параметры: {', '.join(missing)}")
+    dt = _parse_record_time(body["record"])
+    if dt is None:
+        return error("Неверный формат даты")
+    if dt.strftime("%Y-%m-%d %H:%M") in _busy(int(body["cooperator_id"])):
+        return error("Выбранное время уже занято")
+    record_id = next(record_ids)
+    record = {
+        **{k: v for k, v in body.items() if k != "rk"},
+        "id": record_id,
+        "record": dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "price": body.get("price", "0"),
+        "created_at": _now(),
+        "updated_at": _now(),
+    }
+    records[record_id] = record
+    webhook("event-create-record", record)
+    return ok({"id": record_id, "url": f"https://rubitime.ru/card/{record_id}"})
+
+
+def update_record(body: dict) -> JSONResponse:
+    record = records.get(int(body.get("id") or 0))
+    if record is None:
+        return error("Запись не найдена")
+    changes = {k: v for k, v in body.items() if k not in ("rk", "id")}
+    if "record" in changes:
+        dt = _parse_record_time(changes["record"])
+        if dt is None:
+            return error("Неверный формат даты")
+        changes["record"] = dt.strftime("%Y-%m-%d %H:%M:%S")
+    record.update(changes, updated_at=_now())
+    webhook("event-update-record", record)
+    return ok({"id": record["id"], "url": f"https://rubitime.ru/card/{record['id']}"})
+
+
+def get_record(body: dict) -> JSONResponse:
+    record = records.get(int(body.get("id") or 0))
+    if record is None:
+        return error("Запись не найдена")
+    return ok(record)
+
+
+def remove_record(body: dict) -> JSONResponse:
+    record = records.pop(int(body.get("id") or 0), None)
+    if record is None:
+        return error("Запись не найдена")
+    webhook("event-remove-record", {**record, "updated_at": _now()})
+    return ok({"id": record["id"]})
+
+
+METHODS = {
+    "get-schedule": get_schedule,
+    "create-record": create_record,
+    "update-record": update_record,
+    "get-record": get_record,
+    "remove-record": remove_record,
+}
+
+
+@app.post("/api2/{method}")
+async def rubitime_api(method: str, request: Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        return error("Неверный JSON")
+    rk = body.get("rk")
+    if SIMULATOR_API_KEY and rk != SIMULATOR_API_KEY:
+        return error("Неверный ключ API")
+    # Как в Rubitime: не чаще одного запроса в SIMULATOR_RATE_INTERVAL секунд на ключ.
+    now = time.monotonic()
+    last = last_request.get(rk)
+    if last is not None and now - last < SIMULATOR_RATE_INTERVAL:
+        return error(f"Отправлять запросы можно не чаще одного раза в {SIMULATOR_RATE_INTERVAL:g} секунд",
+                     status_code=429)
+    last_request[rk] = now
+    handler = METHODS.get(method)
+    if handler is None:
+        return error("Метод не найден")
+    if SIMULATOR_LATENCY:
+        await asyncio.sleep(SIMULATOR_LATENCY)
+    return handler(body)
+
+
+def _sms_error(code: int, text: str) -> dict:
+    return {"status": "ERROR", "status_code": code, "status_text": text}
+
+
+@app.api_route("/sms/send", methods=["GET", "POST"])
+async def sms_send(request: Request):
+    global balance
+    params = dict(request.query_params)
+    if request.method == "POST":
+        params.update(await request.form())
+    messages = {}
+    for key, value in params.items():
+        match = re.fullmatch(r"(?:multi|to)\[(.+)]", key)
+        if match:
+            messages[match.group(1)] = value
+    if params.get("to") and params.get("msg"):
+        for phone in params["to"].split(","):
+            messages[phone.strip()] = params["msg"]
+    if not params.get("api_id"):
+        return {"status": "ERROR", "status_code": 200, "status_text": "Неправильный api_id"}
+    if not messages:
+        return {"status": "ERROR", "status_code": 203, "status_text": "Нет текста сообщения"}
+    if len(messages) > 100:
+        return {"status": "ERROR", "status_code": 213, "status_text": "Указано более 100 номеров"}
+    sms = {}
+    for phone, text in messages.items():
+        if not re.fullmatch(r"\d{11}", phone.lstrip("+")):
+            sms[phone] = _sms_error(202, "Неправильно указан номер телефона получателя")
+        elif not text:
+            sms[phone] = _sms_error(203, "Нет текста сообщения")
+        else:
+            balance -= 1.5
+            sms[phone] = {"status": "OK", "status_code": 100, "sms_id": f"000000-{next(sms_ids):08d}"}
+    return {"status": "OK", "status_code": 100, "sms": sms, "balance": round(balance, 2)}
@@ -1,10 +1,71 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import datetime
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import (
+    Column, Integer, String, Float, ForeignKey, DateTime, Boolean, Text, Index, event, inspect,
+    select, insert, delete, func, literal
+)
+
+from services.logger import get_logger
+from services.tracing import TracedAsyncSession
+
+load_dotenv()
+
+log = get_logger("db")
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///rubitime.db")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Отрицательное значение — размер кэша страниц в КиБ.
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+
+def _sqlite_pragmas(read_only: bool) -> list[str]:
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # WAL сохраняется в файле БД: читатели не блокируют писателя и наоборот.
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+    return pragmas
+
+
+def create_engine_from_url(url: str = DATABASE_URL, read_only: bool = False, tuned: bool = True) -> AsyncEngine:
+    """Создаёт движок БД; для SQLite включает WAL и настраивает соединения."""
+    engine = create_async_engine(
+        url, echo=False, future=True,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=3600
+    )
+    if tuned and url.startswith("sqlite"):
+        pragmas = _sqlite_pragmas(read_only)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return engine
+
 
-DATABASE_URL = "sqlite+aiosqlite:///rubitime.db"
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+engine = create_engine_from_url(DATABASE_URL)
+# Отдельный пул только для чтения: тяжёлые выборки не ждут соединений писателей.
+read_engine = create_engine_from_url(DATABASE_URL, read_only=True)
+# Запросы внутри трассы обработчика бота попадают в неё span'ами (см. services/tracing.py).
+async_session = sessionmaker(engine, expire_on_commit=False, class_=TracedAsyncSession)
+async_read_session = sessionmaker(read_engine, expire_on_commit=False, class_=TracedAsyncSession)
 Base = declarative_base()
 
 
@@ -29,6 +90,13 @@ class Service(Base):
     cooperator = relationship("Cooperator", back_populates="services")
 
 
+class CatalogVersion(Base):
+    """Счётчик версий справочника сотрудников и услуг (для сброса кэшей во всех процессах)."""
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
 class ReminderRecord(Base):
     """Модель записи напоминания."""
     __tablename__ = "reminder_records"
@@ -41,9 +109,154 @@ class ReminderRecord(Base):
     reminded_24h = Column(Boolean, default=False)
     reminded_12h = Column(Boolean, default=False)
     confirmed = Column(Boolean, default=False)
+    synced_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Поиск по вебхуку и защита от дублей одной записи Rubitime.
+        Index("ix_reminder_records_rubitime_id", rubitime_id, unique=True),
+        # Записи пользователя (my_records, cancel_record, проверка занятости в get_phone).
+        Index("ix_reminder_records_user_id_datetime", user_id, datetime),
+        # Будущие записи без последнего напоминания (планировщик напоминаний).
+        Index("ix_reminder_records_pending", datetime, sqlite_where=reminded_12h == False),
+        # Подтверждённые записи для сверки с Rubitime.
+        Index("ix_reminder_records_confirmed", datetime, sqlite_where=confirmed == True),
+        # Выборка прошедших записей для архивации.
+        Index("ix_reminder_records_datetime", datetime),
+    )
+
+
+class ArchivedRecord(Base):
+    """Модель прошедшей записи, перенесённой в архив."""
+    __tablename__ = "reminder_records_archive"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    record_id = Column(Integer, nullable=False)
+    rubitime_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=False)
+    datetime = Column(DateTime, nullable=False)
+    name = Column(String, nullable=False)
+    phone = Column(String, nullable=False)
+    reminded_24h = Column(Boolean, default=False)
+    reminded_12h = Column(Boolean, default=False)
+    confirmed = Column(Boolean, default=False)
+    synced_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    # Колонки, копируемые из reminder_records при переносе в архив.
+    COPIED_COLUMNS = (
+        "rubitime_id", "user_id", "datetime", "name", "phone",
+        "reminded_24h", "reminded_12h", "confirmed", "synced_at",
+    )
+
+    __table_args__ = (
+        Index("ix_reminder_records_archive_user_id_datetime", user_id, datetime),
+        Index("ix_reminder_records_archive_datetime", datetime),
+    )
+
+
+class RubitimeRecord(Base):
+    """Локальная копия записи Rubitime, собранная из вебхуков и get-record."""
+    __tablename__ = "rubitime_records"
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    branch_id = Column(Integer, nullable=True)
+    cooperator_id = Column(Integer, nullable=True)
+    service_id = Column(Integer, nullable=True)
+    status = Column(Integer, nullable=True)
+    record = Column(DateTime, nullable=True)
+    name = Column(String, nullable=True)
+    phone = Column(String, nullable=True)
+    price = Column(Float, nullable=True)
+    user_id = Column(Integer, nullable=True)
+    data = Column(Text, nullable=False)
+    version = Column(Float, nullable=False, default=0)
+    synced_at = Column(DateTime, nullable=False)
+    removed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_rubitime_records_record", record),
+        Index("ix_rubitime_records_cooperator_id_record", cooperator_id, record),
+    )
+
+
+class FSMStateRecord(Base):
+    """Состояние диалога бота (aiogram FSM), общее для всех процессов бота."""
+    __tablename__ = "fsm_states"
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=False, default="{}")
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_fsm_states_updated_at", updated_at),
+    )
+
+
+class WebhookEvent(Base):
+    """Событие вебхука Rubitime в очереди на применение."""
+    __tablename__ = "webhook_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event = Column(String, nullable=False)
+    rubitime_id = Column(Integer, nullable=False)
+    payload = Column(Text, nullable=False)
+    fingerprint = Column(String, nullable=True)
+    received_at = Column(DateTime, nullable=False)
+    processed_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Очередь необработанных событий в порядке поступления.
+        Index("ix_webhook_events_pending", id, sqlite_where=processed_at == None),
+        Index("ix_webhook_events_processed_at", processed_at),
+    )
+
+
+def _add_missing_columns(conn) -> None:
+    """Добавляет в существующие таблицы колонки, появившиеся в моделях."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+
+def _archive_duplicate_records(conn) -> None:
+    """Переносит в архив все копии записи Rubitime, кроме последней, — перед уникальным индексом."""
+    latest = select(func.max(ReminderRecord.id)).group_by(ReminderRecord.rubitime_id)
+    duplicate = (ReminderRecord.rubitime_id != None) & ReminderRecord.id.not_in(latest)
+    rows = conn.execute(select(ReminderRecord.id, ReminderRecord.rubitime_id).where(duplicate)).all()
+    if not rows:
+        return
+    source = select(
+        ReminderRecord.id,
+        *(getattr(ReminderRecord, name) for name in ArchivedRecord.COPIED_COLUMNS),
+        literal(datetime.datetime.now(), ArchivedRecord.archived_at.type),
+    ).where(duplicate)
+    conn.execute(
+        insert(ArchivedRecord).from_select(["record_id", *ArchivedRecord.COPIED_COLUMNS, "archived_at"], source)
+    )
+    conn.execute(delete(ReminderRecord).where(ReminderRecord.id.in_([record_id for record_id, _ in rows])))
+    log.warning("duplicate reminder records moved to archive", extra={
+        "count": len(rows), "rubitime_ids": sorted({rubitime_id for _, rubitime_id in rows})
+    })
+
+
+def _create_missing_indexes(conn) -> None:
+    """Создаёт индексы моделей в уже существующих таблицах."""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if index.name == "ix_reminder_records_rubitime_id":
+                _archive_duplicate_records(conn)
+            index.create(conn)
 
 
 async def init_db() -> None:
     """Инициализирует базу данных."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
@@ -0,0 +1,28 @@
+import asyncio
+import os
+import tempfile
+
+# База тестов — временный файл SQLite; задаётся до импорта static.models.
+_db_dir = tempfile.mkdtemp(prefix="rubitime-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'test.db')}"
+
+import pytest  # noqa: E402
+
+from static.models import engine, read_engine, init_db  # noqa: E402
+
+
+def run(coro):
+    """Выполняет корутину в новом цикле событий и закрывает соединения пулов, привязанные к нему."""
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+            await read_engine.dispose()
+    return asyncio.run(wrapper())
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    run(init_db())
+    yield os.environ["DATABASE_URL"]
@@ -0,0 +1,104 @@
+import datetime
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import update
+from sqlalchemy.orm import sessionmaker
+
+from conftest import run
+from services.fsm_storage import SQLAlchemyStorage
+from services.tracing import TracedAsyncSession
+from static.models import DATABASE_URL, FSMStateRecord, async_session, create_engine_from_url
+
+
+def _key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+async def _age(storage: SQLAlchemyStorage, key: StorageKey, seconds: int) -> None:
+    """Сдвигает время последнего обновления записи в прошлое."""
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                update(FSMStateRecord)
+                .where(FSMStateRecord.key == storage.key_builder.build(key))
+                .values(updated_at=datetime.datetime.now() - datetime.timedelta(seconds=seconds))
+            )
+
+
+def test_state_and_data_roundtrip():
+    storage, key = SQLAlchemyStorage(), _key(101)
+
+    async def scenario():
+        await storage.set_state(key, "Form:date")
+        await storage.set_data(key, {"service": "стрижка"})
+        await storage.update_data(key, {"date": "2026-10-20"})
+        return await storage.get_state(key), await storage.get_data(key)
+
+    assert run(scenario()) == ("Form:date", {"service": "стрижка", "date": "2026-10-20"})
+
+
+def test_missing_key_is_empty():
+    storage, key = SQLAlchemyStorage(), _key(102)
+
+    async def scenario():
+        return await storage.get_state(key), await storage.get_data(key)
+
+    assert run(scenario()) == (None, {})
+
+
+def test_expired_record_resets_state_and_data():
+    storage, key = SQLAlchemyStorage(ttl=60), _key(103)
+
+    async def scenario():
+        await storage.set_state(key, "Form:time")
+        await storage.set_data(key, {"date": "2026-10-20"})
+        await _age(storage, key, 120)
+        expired = await storage.get_state(key), await storage.get_data(key)
+        # Запись одного поля не должна «воскрешать» второе.
+        await storage.set_data(key, {"service": "окрашивание"})
+        return expired, (await storage.get_state(key), await storage.get_data(key))
+
+    expired, after_write = run(scenario())
+    assert expired == (None, {})
+    assert after_write == (None, {"service": "окрашивание"})
+
+
+def test_cleanup_removes_only_expired():
+    storage = SQLAlchemyStorage(ttl=60)
+    old, fresh = _key(104), _key(105)
+
+    async def scenario():
+        await storage.set_state(old, "Form:date")
+        await storage.set_state(fresh, "Form:date")
+        await _age(storage, old, 120)
+        removed = await storage.cleanup()
+        return removed, await storage.get_state(fresh)
+
+    removed, fresh_state = run(scenario())
+    assert removed == 1
+    assert fresh_state == "Form:date"
+
+
+def test_two_storages_share_one_file():
+    key = _key(106)
+
+    async def scenario():
+        # Второй «процесс» — свой движок на тот же файл базы.
+        other_engine = create_engine_from_url(DATABASE_URL)
+        other = SQLAlchemyStorage(
+            session_factory=sessionmaker(other_engine, expire_on_commit=False, class_=TracedAsyncSession),
+            read_session_factory=sessionmaker(other_engine, expire_on_commit=False, class_=TracedAsyncSession),
+        )
+        first = SQLAlchemyStorage()
+        try:
+            await first.set_state(key, "Form:phone")
+            await first.set_data(key, {"name": "Анна"})
+            seen = await other.get_state(key), await other.get_data(key)
+            await other.update_data(key, {"phone": "79990000000"})
+            return seen, await first.get_data(key)
+        finally:
+            await other_engine.dispose()
+
+    seen, merged = run(scenario())
+    assert seen == ("Form:phone", {"name": "Анна"})
+    assert merged == {"name": "Анна", "phone": "79990000000"}
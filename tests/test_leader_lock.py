@@ -0,0 +1,20 @@
+from services.leader_lock import LeaderLock, configured_workers
+
+
+def test_configured_workers(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert configured_workers(["uvicorn", "app:app"]) == 1
+    assert configured_workers(["uvicorn", "app:app", "--workers", "4"]) == 4
+    assert configured_workers(["uvicorn", "app:app", "--workers=2"]) == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert configured_workers(["uvicorn", "app:app"]) == 3
+
+
+def test_second_lock_is_not_leader(tmp_path):
+    path = str(tmp_path / "bot.lock")
+    first, second = LeaderLock(path), LeaderLock(path)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
@@ -0,0 +1,39 @@
+import datetime
+
+import pytest
+from sqlalchemy import text
+
+from conftest import run
+from services.record_service import (
+    user_records_query, user_reminders_query, user_record_at_query, records_by_rubitime_id_query, records_query
+)
+from services.record_sync import select_due_query
+from services.reminder_scheduler import resync_query
+from static.models import engine
+
+NOW = datetime.datetime(2030, 1, 1, 12, 0)
+
+# Горячие запросы к reminder_records в том виде, в каком их строят бот, вебхук и фоновые задачи.
+HOT_QUERIES = {
+    "my_records": user_records_query(1),
+    "cancel_record": user_reminders_query(1),
+    "get_phone": user_record_at_query(1, NOW),
+    "webhook": records_by_rubitime_id_query([1, 2]),
+    "reminder_scheduler.resync": resync_query(NOW, NOW + datetime.timedelta(hours=25)),
+    "record_sync.select_due": select_due_query(NOW, NOW - datetime.timedelta(minutes=5)),
+    "admin.records": records_query(date_from=NOW, after=(NOW, 1)),
+    "admin.records.user": records_query(user_id=1, after=(NOW, 1)),
+}
+
+
+async def _explain(stmt) -> list[str]:
+    async with engine.connect() as conn:
+        compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        result = await conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+        return [row[-1] for row in result]
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_index(name):
+    plan = run(_explain(HOT_QUERIES[name]))
+    assert not [step for step in plan if step.startswith("SCAN reminder_records")], plan
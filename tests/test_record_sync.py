@@ -0,0 +1,68 @@
+import datetime
+
+from sqlalchemy import select
+
+from conftest import run
+from services import record_sync
+from services.record_sync import RecordReconciler
+from static.models import ReminderRecord, RubitimeRecord, async_session
+
+
+class FakeClient:
+    def __init__(self, responses: dict[int, dict]):
+        self.responses = responses
+
+    async def call(self, method, payload=None, priority=0):
+        return self.responses[payload["id"]]
+
+
+async def _add_record(rubitime_id: int, dt: datetime.datetime) -> int:
+    async with async_session() as session:
+        record = ReminderRecord(rubitime_id=rubitime_id, user_id=1, datetime=dt, name="n", phone="1", confirmed=True)
+        session.add(record)
+        await session.commit()
+        return record.id
+
+
+async def _state(record_id: int, rubitime_id: int):
+    async with async_session() as session:
+        record = await session.get(ReminderRecord, record_id)
+        mirror = await session.get(RubitimeRecord, rubitime_id)
+        return record, mirror
+
+
+def test_only_not_found_removes_record():
+    dt = (datetime.datetime.now() + datetime.timedelta(days=2)).replace(microsecond=0)
+
+    async def scenario():
+        gone = await _add_record(501, dt)
+        throttled = await _add_record(502, dt)
+        client = FakeClient({
+            501: {"status": "error", "message": "Запись не найдена", "data": None},
+            502: {"status": "error", "message": "Превышен лимит запросов", "data": None},
+        })
+        stats = await RecordReconciler(client).run_pass()
+        return stats, await _state(gone, 501), await _state(throttled, 502)
+
+    stats, (gone, gone_mirror), (kept, kept_mirror) = run(scenario())
+    assert stats["removed"] == 1 and stats["errors"] == 1
+    assert gone is None and gone_mirror.removed_at is not None
+    assert kept is not None and kept_mirror is None
+
+
+def test_moved_record_is_rescheduled(monkeypatch):
+    dt = (datetime.datetime.now() + datetime.timedelta(days=3)).replace(microsecond=0)
+    remote_dt = dt + datetime.timedelta(hours=2)
+    scheduled = []
+    monkeypatch.setattr(record_sync.reminder_scheduler, "schedule", lambda *args: scheduled.append(args))
+
+    async def scenario():
+        record_id = await _add_record(503, dt)
+        client = FakeClient({503: {"status": "ok", "data": {"id": 503, "record": f"{remote_dt:%Y-%m-%d %H:%M:%S}"}}})
+        await RecordReconciler(client).run_pass()
+        async with async_session() as session:
+            return record_id, await session.scalar(select(ReminderRecord.datetime).where(ReminderRecord.id == record_id))
+
+    record_id, stored = run(scenario())
+    assert stored == remote_dt
+    assert scheduled == [(record_id, remote_dt, False, False)]
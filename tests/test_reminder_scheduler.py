@@ -0,0 +1,64 @@
+import asyncio
+import datetime
+
+from conftest import run
+from services import reminder_scheduler as scheduler_module
+from services.reminder_scheduler import ReminderScheduler
+from services.telegram_sender import SENT
+from static.models import ReminderRecord, async_session
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = []
+
+    async def send_many(self, messages):
+        self.sent += messages
+        return [SENT] * len(messages)
+
+
+async def _add_record(rubitime_id: int, dt: datetime.datetime) -> int:
+    async with async_session() as session:
+        record = ReminderRecord(rubitime_id=rubitime_id, user_id=7, datetime=dt, name="n", phone="1")
+        session.add(record)
+        await session.commit()
+        return record.id
+
+
+def test_record_scheduled_twice_is_reminded_once():
+    # Внутри окна 24-часового напоминания.
+    dt = (datetime.datetime.now() + datetime.timedelta(hours=23)).replace(microsecond=0)
+
+    async def scenario():
+        record_id = await _add_record(601, dt)
+        scheduler, sender = ReminderScheduler(), FakeSender()
+        scheduler._running = True
+        scheduler.schedule(record_id, dt)
+        scheduler.schedule(record_id, dt)
+        await scheduler._fire(scheduler._pop_due(datetime.datetime.now()), sender)
+        return sender.sent
+
+    assert len(run(scenario())) == 1
+
+
+def test_run_survives_resync_error(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "REMINDER_RETRY_DELAY", 0.05)
+    calls = []
+
+    async def flaky_resync():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+
+    async def scenario():
+        scheduler = ReminderScheduler()
+        scheduler.resync = flaky_resync
+        task = asyncio.create_task(scheduler.run(FakeSender()))
+        await asyncio.sleep(0.3)
+        alive = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return alive
+
+    assert run(scenario())
+    assert len(calls) >= 2
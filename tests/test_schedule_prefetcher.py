@@ -0,0 +1,30 @@
+import asyncio
+
+from services import schedule_prefetcher as prefetcher_module
+from services.schedule_cache import ScheduleCache
+from services.schedule_prefetcher import SchedulePrefetcher
+
+
+def test_run_survives_catalog_error(monkeypatch):
+    calls = []
+
+    async def flaky_load_pairs():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database is locked")
+        return []
+
+    async def scenario():
+        prefetcher = SchedulePrefetcher(ScheduleCache(), 1, fetch=None)
+        prefetcher.gap = 0.01
+        prefetcher.load_pairs = flaky_load_pairs
+        monkeypatch.setattr(prefetcher_module, "PAIRS_REFRESH_INTERVAL", 0.05)
+        task = asyncio.create_task(prefetcher.run())
+        await asyncio.sleep(0.2)
+        alive = not task.done()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return alive
+
+    assert asyncio.run(scenario())
+    assert len(calls) >= 2
@@ -0,0 +1,50 @@
+import asyncio
+
+from aiohttp import web
+
+from services.sms_queue import SmsDispatcher
+
+
+async def _send_with_stub(handler, **kwargs) -> dict:
+    app = web.Application()
+    app.router.add_post("/sms/send", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    dispatcher = SmsDispatcher("key", url=f"http://127.0.0.1:{port}/sms/send", window=0.01, **kwargs)
+    try:
+        return await asyncio.wait_for(dispatcher.send("+79000000000", "1234"), 5)
+    finally:
+        await dispatcher.close()
+        await runner.cleanup()
+
+
+def test_send_returns_status_per_phone():
+    async def handler(request):
+        return web.json_response({"status": "OK", "sms": {"79000000000": {"status": "OK", "status_code": 100}}})
+
+    assert asyncio.run(_send_with_stub(handler)) == {"status": "OK", "status_code": 100}
+
+
+def test_send_resolves_on_non_json_response():
+    async def handler(request):
+        return web.Response(text="<html>Bad Gateway</html>", content_type="text/html")
+
+    assert asyncio.run(_send_with_stub(handler))["status"] == "ERROR"
+
+
+def test_send_resolves_on_non_dict_response():
+    async def handler(request):
+        return web.json_response(["unexpected"])
+
+    assert asyncio.run(_send_with_stub(handler))["status"] == "ERROR"
+
+
+def test_send_times_out():
+    async def handler(request):
+        await asyncio.sleep(2)
+        return web.json_response({"status": "OK", "sms": {}})
+
+    assert asyncio.run(_send_with_stub(handler, send_timeout=0.2))["status"] == "ERROR"